@@ -4,12 +4,24 @@
 Python: 3.10.5
 """
 
+import sqlite3
 import sys, getopt
 
 from pathlib import Path
 
 from artnet_tools import ArtNetPlayback, ArtNetRecord
-from helpfunctions import bcolors
+from daemon import ArtNetDaemon
+from edit import run_edit
+from helpfunctions import bcolors, parse_channels, parse_universes
+from interpolate import parse_hold
+from library import RecordingLibrary
+from preroll import PrerollCapture
+from profiler import StageProfiler
+from recovery import run_recovery
+from sharded import ShardedRecord
+from shows import ShowEngine
+from timecode import TC_FPS, TimecodeGenerator
+from timer import PlaybackTimer
 
 __author__ = "Leonhard Axtner"
 __copyright__ = "Copyright (C) 2022  Leonhard Axtner"
@@ -120,7 +132,7 @@ class Menu:
 
     def init_record(self, path: Path, universes):
         if universes != "":
-            universes = [int(i) for i in universes.strip('" ').split(',')]
+            universes = parse_universes(universes)
 
             self.rec = ArtNetRecord(universes, self.record_dur, path)
             self.rec.record()
@@ -128,6 +140,27 @@ class Menu:
         else:
             print(bcolors.FAIL + "No universes given." + bcolors.ENDC)
 
+    def show_library(self, path: Path):
+        """Updates and prints the recording index of a directory
+
+        Args:
+            path (Path): Directory of recordings
+        """
+        try:
+            library = RecordingLibrary(path)
+        except sqlite3.Error as e:
+            print(bcolors.FAIL + "Can't open the recording index of '{}': {}".format(path, e) + bcolors.ENDC)
+            return
+
+        try:
+            scanned = library.update()
+            library.print_table()
+            print("{} recordings, {} (re)scanned".format(len(library.files()), scanned))
+        except sqlite3.Error as e:
+            print(bcolors.FAIL + "Can't update the recording index of '{}': {}".format(path, e) + bcolors.ENDC)
+        finally:
+            library.close()
+
     def exit_skript(self):
         print(bcolors.PINK + 'Alright, bye!' + bcolors.ENDC)
         sys.exit(0)
@@ -159,7 +192,7 @@ class Menu:
                 if option == 1:
                     
                     # Get user input
-                    universes = self.wait_for_input(promt='Universes to record', example='"0,1,2,3"', data_type=str)
+                    universes = self.wait_for_input(promt='Universes to record', example='"0,1,2,3" or "0-15,1.2.0-1.2.15"', data_type=str)
                     path = self.wait_for_input(promt = "Output dir/file path [leave empty for current dir]:", example = '"C:/Users/output.dat"', data_type=Path)
 
                     # Start recording
@@ -193,6 +226,11 @@ class Menu:
                     
                     # Get user input
                     path = self.wait_for_input(promt='Enter Filepath or Directory:', example='"C:/User/example.dat"', data_type=Path)
+
+                    # Show what will be played
+                    if path.is_dir():
+                        self.show_library(path)
+
                     ip = self.wait_for_input(promt='Enter IP:', example='"10.0.0.5"', data_type=str)
 
                     # Start playback
@@ -224,34 +262,114 @@ class Menu:
 
     def argparse(self, argv) -> int:
         input_path = Path()
+        input_paths = []
         output = Path()
         mode = ''
         shuffle_loop = False
+        merge = None
+        chase = None
+        sync = None
+        tc_start = "00:00:00:00"
+        tc_type = 1
         ip = ''
         universes = []
+        shards = None
+        control_port = ArtNetDaemon.CONTROL_PORT
+        profile = False
+        profile_out = None
+        timer = 'hybrid'
+        spin_window = PlaybackTimer.SPIN_WINDOW
+        realtime = False
+        cpu = None
+        start = None
+        end = None
+        checkpoint = ArtNetRecord.CHECKPOINT_INTERVAL
+        channels = None
+        precompile = True
+        interfaces = None
+        sources = None
+        window = 5
+        forward = []
+        interpolate = None
+        hold = None
+        shows = []
         debug = 0
         help = self.logo() + """
 Usage: ARPS.py [OPTIONS] or with menu.
 
 -h, --help: Print this help
 -v, --verbose (n): Prints debug msg every n frames 
--m, --mode (r,rec,record / p,play,playback): Mode to run in
+--profile: Print the time per packet of every stage of record or playback
+--profile-out (out.prof / out.folded): Also dump cProfile stats (.prof) or folded stacks for flamegraphs
+-m, --mode (r,rec,record / pre,preroll / p,play,playback / d,daemon / s,shows / tc,timecode / ls,library /
+            trim / cut / concat / extract / drop / compact / recover): Mode to run in
 
 """ + bcolors.OKGREEN +"""----------playback----------
 -l, --loop: Playback in loop, shuffle after each loop
 -a, --adress (10.1.2.3): IP of Art-Net destination
--i, --ifile: File or directory to play from
+-i, --ifile: File or directory to play from, repeat for multiple files
+--merge (htp/ltp): Play all files at once, merged per universe and channel
+--sync (replay/frame): Replay recorded ArtSync or synthesize it after every frame
+--chase (01:00:00:00): Chase ArtTimeCode, timecode of the recordings start
+--fps (24/25/29.97/30): Timecode frame rate, default 25
+--timer (sleep/hybrid/spin): Wait strategy, from least CPU to most precise, default hybrid
+--spin (200): Microseconds spun before each packet with the hybrid timer
+--realtime: Run playback with SCHED_FIFO, needs root or CAP_SYS_NICE (dedicated hosts only)
+--cpu (n): Pin playback to CPU n
+--channels (auto / 0-3:48,7:96): Send only the channels in use per universe, 'auto' analyzes the files first
+--stream: Parse the file while sending, instead of compiling it to packets ahead in a worker process
+--interpolate (100): Play linearly faded frames at this rate in Hz, smooths 25-30Hz recordings
+--hold (0-3:1-4+9,7:12): Channels per universe that step instead of fading, e.g. gobos and modes
 
 """ + bcolors.OKBLUE +"""----------record----------
--u, --universes (0,1,2,3): Universes to record
+-u, --universes (0,1,4-7,1.2.3): Universes to record, ranges and Net.Sub.Universe allowed
 -d, --duration (30): Duration of recording in minutes
 -o, --out: Output file or directory
+--shards (n): Record with n worker processes, 0 for one per spare core
+--checkpoint (1.0): Seconds between checksummed and fsynced checkpoints, 0 disables them
+--channels (0-3:48,7:96): Store only these channels per universe
+--bind (eth1,10.0.0.5): Listen only on these interfaces or IPs, an IP receives no broadcasts
+--allow (10.0.0.20,10.0.0.21): Record only packets of these senders, dropped by the kernel on Linux
+--forward (10.1.0.255 / "10.2.0.5/0-3>10"): Forward the recorded universes to this node, optionally remapped, repeat per node
+
+----------pre-roll----------
+-u, --universes, --channels, --bind, --allow: What to capture, see record
+--window (5): Minutes kept in memory per universe
+-o, --out: Directory of the saved recordings
+--control (7777): Local UDP port for commands: save [file], record [file], stop, status
+
+""" + bcolors.OKCYAN +"""----------daemon----------
+-a, --adress (10.1.2.3): IP of Art-Net destination
+-i, --ifile: File or directory to preload
+--control (7777): Local UDP port for commands: play <cue> [s], stop, seek <s>, rate <x>, list, status
+
+----------shows----------
+--show (a.rawrec@10.0.0.5+30): Recording, its destination and start in seconds, repeat for every show
+--sync (replay): Replay the recorded ArtSync of every show
+--timer, --spin, --realtime, --cpu: Timing of the single playback thread, see playback
+
+""" + bcolors.PINK +"""----------timecode----------
+-a, --adress (10.1.2.255): IP or broadcast adress of the chasing hosts
+--tc-start (01:00:00:00): Start timecode of the generator
+--fps (24/25/29.97/30): Timecode frame rate, default 25
+
+""" + bcolors.WARNING +"""----------edit----------
+-i, --ifile: Recording to edit, repeat for concat
+-o, --out: Output file or directory
+--start (12.5), --end (60): Time range in seconds for trim (keep it) and cut (remove it)
+-u, --universes (0-3,7): Universes for extract (keep them) and drop (remove them)
+-m compact: Trim every packet to the channels in use, analyzed or given with --channels
+-m recover -i (file.rawrec.part): Add the footer to a recording left by a crash, cuts a broken tail, merges the streams of --shards
 """ + bcolors.ENDC
 
         try:
             opts, args = getopt.getopt(
                 argv, "hlm:i:a:u:d:o:v:",
-                ["help", "loop", "mode=", "adress=", "ifile=", "universes=", "duration=", "out=", "verbose="])
+                ["help", "loop", "mode=", "adress=", "ifile=", "universes=", "duration=", "out=", "verbose=",
+                 "merge=", "sync=", "chase=", "fps=", "tc-start=", "shards=", "control=", "profile", "profile-out=",
+                 "timer=", "spin=", "realtime", "cpu=", "start=", "end=", "checkpoint=", "channels=", "show=", "stream",
+                 "bind=", "allow=", "window=", "forward=",
+                 "interpolate=", "hold="])
         except getopt.GetoptError:
             print(help)
             sys.exit(2)
@@ -276,14 +394,110 @@ Usage: ARPS.py [OPTIONS] or with menu.
                     elif arg in ('play','p','playback'):
                         mode = 'rep'
 
+                    elif arg in ('preroll','pre'):
+                        mode = 'pre'
+
+                    elif arg in ('library','ls'):
+                        mode = 'ls'
+
+                    elif arg in ('daemon','d'):
+                        mode = 'daemon'
+
+                    elif arg in ('shows','s'):
+                        mode = 'shows'
+
+                    elif arg in ('timecode','tc'):
+                        mode = 'tc'
+
+                    elif arg in ('trim','cut','concat','extract','drop','compact','recover'):
+                        mode = arg
+
                 elif opt in ("-i", "--ifile"):
                     input_path = Path(arg.strip('" '))
+                    input_paths.append(input_path)
+
+                elif opt == "--merge":
+                    merge = arg.strip('" ').lower()
+
+                elif opt == "--sync":
+                    sync = arg.strip('" ').lower()
+
+                elif opt == "--chase":
+                    chase = arg.strip('" ')
+
+                elif opt == "--profile":
+                    profile = True
+
+                elif opt == "--profile-out":
+                    profile = True
+                    profile_out = Path(arg.strip('" '))
+
+                elif opt == "--timer":
+                    timer = arg.strip('" ').lower()
+
+                elif opt == "--spin":
+                    spin_window = int(float(arg) * 10**3)
+
+                elif opt == "--realtime":
+                    realtime = True
+
+                elif opt == "--cpu":
+                    cpu = int(arg)
+
+                elif opt == "--bind":
+                    interfaces = [i.strip() for i in arg.strip('" ').split(',') if i.strip()]
+
+                elif opt == "--allow":
+                    sources = [s.strip() for s in arg.strip('" ').split(',') if s.strip()]
+
+                elif opt == "--interpolate":
+                    interpolate = float(arg)
+
+                elif opt == "--hold":
+                    hold = parse_hold(arg)
+
+                elif opt == "--forward":
+                    forward.append(arg.strip('" '))
+
+                elif opt == "--window":
+                    window = float(arg)
+
+                elif opt == "--stream":
+                    precompile = False
+
+                elif opt == "--show":
+                    shows.append(arg)
+
+                elif opt == "--channels":
+                    arg = arg.strip('" ').lower()
+                    channels = arg if arg == 'auto' else parse_channels(arg)
+
+                elif opt == "--checkpoint":
+                    checkpoint = float(arg)
+
+                elif opt == "--start":
+                    start = float(arg)
+
+                elif opt == "--end":
+                    end = float(arg)
+
+                elif opt == "--control":
+                    control_port = int(arg)
+
+                elif opt == "--shards":
+                    shards = int(arg)
+
+                elif opt == "--tc-start":
+                    tc_start = arg.strip('" ')
+
+                elif opt == "--fps":
+                    tc_type = {fps: tc for tc, fps in TC_FPS.items()}[float(arg)]
 
                 elif opt in ("-a", "--adress"):
                     ip = arg.strip('"')
 
                 elif opt in ("-u", "--universes"):
-                    universes = list(map(int, arg.split(',')))
+                    universes = parse_universes(arg)
 
                 elif opt in ("-d", "--duration"):
                     self.record_dur = int(arg)
@@ -297,15 +511,76 @@ Usage: ARPS.py [OPTIONS] or with menu.
         except Exception as e:
             print("Something went wrong parsing the arguments:", e)
             return -1
-            
-        if mode == 'rec':
-            self.rec = ArtNetRecord(universes, self.record_dur, output, debug)
+
+        # Only playback can analyze the files, compact analyzes them without --channels
+        if channels == 'auto' and mode not in ('rep', 'compact'):
+            print(bcolors.FAIL + "--channels auto analyzes recordings, it only works for playback. "
+                  "Give the channels like 0-3:48,7:96." + bcolors.ENDC)
+            return -1
+
+        if profile and mode not in ('rec', 'rep'):
+            print(bcolors.FAIL + "--profile times the stages of record and playback, it can't be used with --mode {}."
+                  .format(mode) + bcolors.ENDC)
+            return -1
+
+        profiler = StageProfiler('record' if mode == 'rec' else 'playback', profile_out) if profile else None
+
+        if mode == 'rec' and shards is not None:
+            if profile:
+                print(bcolors.FAIL + "--profile times the single receive thread, it can't be used with --shards."
+                      + bcolors.ENDC)
+                return -1
+
+            self.rec = ShardedRecord(universes, self.record_dur, output, debug=debug, shards=shards,
+                                     checkpoint=checkpoint, channels=channels, interfaces=interfaces, sources=sources,
+                                     forward=forward)
+            self.rec.record()
+
+        elif mode == 'rec':
+            self.rec = ArtNetRecord(universes, self.record_dur, output, debug=debug, profiler=profiler,
+                                    checkpoint=checkpoint, channels=channels, interfaces=interfaces, sources=sources,
+                                    forward=forward)
             self.rec.record()
 
         elif mode == 'rep':
-            self.rep = ArtNetPlayback(ip, input_path, shuffle_loop ,debug)
+            if len(input_paths) > 1:
+                input_path = input_paths
+
+            self.rep = ArtNetPlayback(ip, input_path, shuffle_loop, debug, merge=merge, chase=chase, tc_type=tc_type,
+                                      sync=sync, profiler=profiler,
+                                      timer=PlaybackTimer(timer, spin_window, realtime, cpu), channels=channels,
+                                      precompile=precompile, interpolate=interpolate, hold=hold)
             self.rep.start_playback()
 
+        elif mode == 'pre':
+            self.preroll = PrerollCapture(universes, window, output, control_port, channels, interfaces, sources)
+            self.preroll.run()
+
+        elif mode == 'ls':
+            self.show_library(input_path)
+
+        elif mode == 'daemon':
+            self.daemon = ArtNetDaemon(ip, input_path, control_port, debug)
+            self.daemon.run()
+
+        elif mode == 'shows':
+            self.shows = ShowEngine(shows, sync == 'replay', PlaybackTimer(timer, spin_window, realtime, cpu), debug)
+            self.shows.run()
+
+        elif mode == 'tc':
+            self.tc = TimecodeGenerator(ip, tc_type, tc_start)
+            self.tc.run()
+
+        elif mode == 'recover':
+            run_recovery(input_path)
+
+        elif mode in ('trim', 'cut', 'concat', 'extract', 'drop', 'compact'):
+            try:
+                run_edit(mode, input_paths, output, start, end, universes,
+                         channels if channels != 'auto' else None)
+            except ValueError as e:
+                print(bcolors.FAIL + "Can't {}: {}".format(mode, e) + bcolors.ENDC)
+
         else:
             print(bcolors.FAIL + "Invalid mode. Get some --help." + bcolors.ENDC)
 
@@ -1,18 +1,69 @@
 #!/usr/bin/env python
+import heapq
 import re
-import sys
+import sqlite3
 import threading
 import time
+import zlib
 
+from bisect import bisect_right
 from datetime import datetime
-from os import remove, SEEK_CUR, SEEK_END, walk, rename
+from ipaddress import IPv4Address
+from os import fstat, fsync, remove, SEEK_CUR, SEEK_END, walk, rename
 from pathlib import Path
 from random import shuffle
 from tempfile import gettempdir
 
 # local imports
 import helpfunctions as h
+from compiled import CompiledRecording, SYNC
+from dashboard import Dashboard, SourceStats, TrafficStats
+from edit import analyze_channels
+from forward import ArtNetForwarder
+from interpolate import CARRIES, LOW_BYTES, from_lanes, to_lanes
+from library import RecordingLibrary
+from profiler import StageProfiler
+from recovery import RecoveryInfo
 from smartnet import Smartnet, SmartNetServer
+from timer import PlaybackTimer
+from timecode import PlaybackClock, TimecodeChaser, parse_timecode, timecode_to_ns
+
+
+def merge_htp(buffers: list):
+    """Highest takes precedence, per channel maximum over all layer buffers.
+
+    Two layers at a time, all channels at once: subtracting in lanes with
+    the carry bit set leaves the carry only where the merged value is not
+    lower, that bit widened to 0xFF selects the value of every channel.
+
+    Args:
+        buffers (list): DMX buffers in lanes of every layer on one universe, see interpolate.to_lanes
+
+    Returns:
+        int: merged DMX buffer in lanes
+    """
+    merged = buffers[0]
+    for buffer in buffers[1:]:
+        keep = ((((merged | CARRIES) - buffer) & CARRIES) >> 8) * 0xFF
+        merged = (merged & keep) | (buffer & (keep ^ LOW_BYTES))
+    return merged
+
+
+def merge_ltp(merged: int, old: int, new: int):
+    """Latest takes precedence, every channel that changed in the new layer buffer
+    overwrites the merged buffer, all other channels are kept.
+
+    Args:
+        merged (int): current merged DMX buffer in lanes, see interpolate.to_lanes
+        old (int): previous buffer of the layer that sent, in lanes
+        new (int): new buffer of the layer that sent, in lanes
+
+    Returns:
+        int: merged DMX buffer in lanes
+    """
+    # A changed channel differs in its low byte, adding 0xFF carries it into the lane's carry bit
+    changed = ((((old ^ new) + LOW_BYTES) & CARRIES) >> 8) * 0xFF
+    return (new & changed) | (merged & (changed ^ LOW_BYTES))
 
 
 class ArtNetRecord:
@@ -24,29 +75,43 @@ class ArtNetRecord:
 
     TIMEOUT = 5 *10**9  # 5 Seconds
     MIN_LEN = 10 *10**9  # Minimum n s to save
+    CHECKPOINT_INTERVAL = 1.0  # Seconds between checkpoints and fsyncs
 
     RunCallback = True # Stop Thread Flag
+    fsync_pending = False  # Checkpoint written, not yet on disk
     length = 0  # Records length
     i = 0  # Debug interator
 
-    def __init__(self, universes: list, rec_dur: int, path: Path, compress = False, debug: int = 0):
+    def __init__(self, universes: list, rec_dur: int, path: Path, compress = False, debug: int = 0,
+                 profiler: StageProfiler = None, checkpoint: float = CHECKPOINT_INTERVAL, channels: dict = None,
+                 interfaces: list = None, sources: list = None, forward: list = None):
         """Initializes Recording Class.
 
         Args:
             universes (list): List of universes to record
             rec_dur (int): Duration of recording in minutes, 0 is infinite
+            profiler (StageProfiler): Times the stages of the receive thread
+            checkpoint (float): Seconds between checkpoints, each one is fsynced, 0 disables them
+            channels (dict): Channel count per universe, only these channels are stored
+            interfaces (list): IPs or interface names to listen on, all if None
+            sources (list): IPs of the senders to record, all if None
+            forward (list): Destinations "ip[/remap]" the received packets are forwarded to, see ArtNetForwarder
         """
 
         # Instance variables
         self.compress = compress
+        self.profiler = profiler
+        self.stats = TrafficStats()
+        self.sources = SourceStats()
+        self.interfaces = interfaces
+        self.allowed = [str(IPv4Address(source)) for source in sources] if sources else None
         self.universes = universes
         self.debug = debug
+        self.checkpoint_interval = int(checkpoint * 10**9)
+        self.channels = channels or dict()
 
         self.rec_time = rec_dur * 10**9 if rec_dur > 0 else 86.400*10**9  # 1 day if 0
 
-        # Smartnet instance
-        self.a = SmartNetServer()
-
         # Test if output is a empty, adirectory or a file
         if path == Path():
             self.final_path = Path(Path.cwd(), self.FILENAME + '.artrec' if self.compress else self.FILENAME +  '.rawrec')
@@ -57,8 +122,16 @@ class ArtNetRecord:
         elif path.name != '':
             self.final_path = path
 
-        print(h.bcolors.OKBLUE + "----------record----------\nUniverses: {}\nDuration: {}s\nOutput: '{}' ".format(self.universes,
+        # Written next to the final file, so a crash leaves it where it can be recovered
+        self.part_path = self.final_path.with_suffix('.rawrec.part')
+
+        print(h.bcolors.OKBLUE + "----------record----------\nUniverses: {}\nDuration: {}s\nOutput: '{}' ".format(h.format_universes(self.universes),
                                                                                                                   round(self.rec_time*10**-9), self.final_path) + h.bcolors.ENDC)
+        if interfaces or sources:
+            print(h.bcolors.OKBLUE + "Interfaces: {}\nSources: {}".format(
+                ", ".join(interfaces) if interfaces else "all", ", ".join(sources) if sources else "all") + h.bcolors.ENDC)
+
+        self.forwarder = ArtNetForwarder(forward, universes) if forward else None
 
     def __callback(self, data, universe: int):
         """Callback for every Packet
@@ -68,18 +141,26 @@ class ArtNetRecord:
             universe (int): Universe
         """
         if self.RunCallback:
-            # write line: "int(time since last packet) int(universe) bytearray[data]"
-            delay = time.time_ns() - self.last
+            prof = self.profiler
 
-            try:
-                self.writer.write(str(delay) + " " +
-                                str(universe) + " " + str(data) + "\n")
-
-            except Exception as e:
-                print(h.bcolors.FAIL +
-                    "Error writing to file: {}".format(e) + h.bcolors.ENDC)
+            limit = self.channels.get(universe)
+            if limit is not None:
+                data = data[:limit]
 
-            self.last = time.time_ns()
+            # write line: "int(time since last packet) int(universe) bytearray[data]"
+            # Receive times are kernel timestamps, never run backwards from the conversion jitter
+            now = max(self.a.packet_time, self.last)
+            delay = now - self.last
+            line = h.format_line(delay, universe, data)
+            if prof: prof.lap('format')
+
+            self.last = now
+            self.packets += 1
+            self.write(line)
+            self.stats.count(universe, len(data))
+            if prof:
+                prof.lap('write')
+                prof.packet()
 
             if self.debug:
                 self.i += 1
@@ -89,6 +170,42 @@ class ArtNetRecord:
                         universe, len(data), round(delay * 10**-6, 6)))
                     self.i = 0
 
+    def __sync_callback(self):
+        """Callback for every ArtSync packet"""
+        if self.RunCallback:
+            # write line: "int(time since last packet) sync"
+            now = max(self.a.packet_time, self.last)
+            delay = now - self.last
+
+            self.last = now
+            self.write(str(delay) + " sync\n")
+
+    def write(self, line: str):
+        """Writes a line and adds a checkpoint, when the interval is over"""
+        try:
+            self.writer.write(line)
+            self.stats.written += len(line)
+
+            # Checksum of everything since the last checkpoint
+            self.segment_crc = zlib.crc32(line.encode(), self.segment_crc)
+            self.segment_size += len(line)
+
+            if self.checkpoint_interval and self.last >= self.next_checkpoint:
+                checkpoint = h.make_checkpoint(self.last - self.start, self.packets,
+                                               self.segment_size, self.segment_crc)
+                self.writer.write(checkpoint)
+                self.writer.flush()
+                self.stats.written += len(checkpoint)
+
+                # fsync is left to the main thread, receiving goes on meanwhile
+                self.segment_crc = self.segment_size = 0
+                self.next_checkpoint = self.last + self.checkpoint_interval
+                self.fsync_pending = True
+
+        except Exception as e:
+            print(h.bcolors.FAIL +
+                "Error writing to file: {}".format(e) + h.bcolors.ENDC)
+
     def record(self):
         """Opens a temp file and writes the data to it.
         When recording is finished or timeouted, the file is zipped and moved to the final path
@@ -100,63 +217,127 @@ class ArtNetRecord:
 
         print("Recording started...\nPress Ctrl+C to stop prematurely.")
 
-        with open(self.TMP_PATH, 'w') as self.writer:
-            # Timing variables
-            self.last = time.time_ns()
+        # Smartnet instance
+        self.a = SmartNetServer(self.profiler, self.interfaces, self.allowed)
+        self.a.sources = self.sources
+
+        with open(self.part_path, 'w', newline='\n') as self.writer:
+            # Timing variables, monotonic like the receive times
+            self.last = time.monotonic_ns()
             self.start = self.last
 
+            # Self describing from the start, the checkpoints cover everything after the header
+            header = h.make_header(self.universes)
+            self.writer.write(header)
+            self.writer.flush()
+            self.stats.written += len(header)
+            self.packets = 0
+            self.segment_crc = self.segment_size = 0
+            self.next_checkpoint = self.start + self.checkpoint_interval
+            self.fsync_pending = False
+
+            # Forwarding comes first on the receive path, before the packet is parsed
+            if self.forwarder:
+                self.a.register_raw_listener(self.forwarder.forward)
+
             # Register universe listeners on other threads
             self.a.register_multiple_listeners(
                 self.universes, callback_function=self.__callback)
+            self.a.register_sync_listener(self.__sync_callback)
 
-            try:
-                # Test for elapsed time
-                while time.time_ns() - self.start < self.rec_time*10**9:
-                    self.length = time.time_ns() - self.start # Length in ns
+            self.wait_for_recording()
 
-                    # Refresh console writeout time
-                    sys.stdout.write("\r%.1fs" % (self.length*10**-9))
-                    sys.stdout.flush()
+            # Close properly
+            self.RunCallback = False
+            self.a.register_raw_listener(None)
+            kernel_filter = self.a.kernel_filter
+            del self.a
 
-                    # Timeout if no data is received for the given time
-                    if time.time_ns() - self.last > self.TIMEOUT:
-                        raise TimeoutError
-                    time.sleep(0.2)
+        self.save()
+        self.report_network(kernel_filter)
 
-            # User abort
-            except KeyboardInterrupt:
-                self.debug = False
-                print("\n\n" + h.bcolors.WARNING +
-                      "TERMINATED BY USER, Saving Data...\n" + h.bcolors.ENDC)
+        if self.profiler:
+            self.profiler.report()
 
-            # Timeout abort
-            except TimeoutError:
-                print("\n\n" + h.bcolors.FAIL +
-                      "No data received for {} seconds. Stopped recording.".format(round(self.TIMEOUT*10**-9)) + h.bcolors.ENDC)
+    def report_network(self, kernel_filter: bool):
+        """Prints the per source counters and the forwarding latency
 
-            # Close properly
-            self.RunCallback = False
-            del self.a
+        Args:
+            kernel_filter (bool): Whether the kernel dropped the other sources
+        """
+        self.sources.report()
+        if self.allowed and not kernel_filter:
+            print(h.bcolors.WARNING + "Sources were filtered after receiving, no kernel socket filter." + h.bcolors.ENDC)
+
+        if self.forwarder:
+            self.forwarder.report()
+            self.forwarder.close()
+
+    def disk_usage(self):
+        """Returns the bytes of the recording on disk"""
+        return fstat(self.writer.fileno()).st_size
+
+    def writer_backlog(self):
+        """Returns the data handed to the writer, but not yet on disk"""
+        return "{:.1f} kB".format((self.stats.written - self.disk_usage()) * 10**-3)
+
+    def wait_for_recording(self):
+        """Shows the live status until the duration is over, the user aborts or no data is received"""
+        dashboard = Dashboard(self.stats, self.disk_usage, self.writer_backlog, self.sources)
+        try:
+            # Test for elapsed time
+            while time.monotonic_ns() - self.start < self.rec_time*10**9:
+                self.length = time.monotonic_ns() - self.start # Length in ns
+
+                # Refresh live status
+                status = "Recording %.1fs" % (self.length*10**-9)
+                dashboard.show(status + " | " + self.forwarder.status() if self.forwarder else status)
+
+                # Batched fsync of the last checkpoint
+                if self.fsync_pending:
+                    self.fsync_pending = False
+                    fsync(self.writer.fileno())
+
+                # Timeout if no data is received for the given time
+                if time.monotonic_ns() - self.last > self.TIMEOUT:
+                    raise TimeoutError
+                time.sleep(0.2)
+
+        # User abort
+        except KeyboardInterrupt:
+            self.debug = False
+            print("\n\n" + h.bcolors.WARNING +
+                  "TERMINATED BY USER, Saving Data...\n" + h.bcolors.ENDC)
+
+        # Timeout abort
+        except TimeoutError:
+            print("\n\n" + h.bcolors.FAIL +
+                  "No data received for {} seconds. Stopped recording.".format(round(self.TIMEOUT*10**-9)) + h.bcolors.ENDC)
+
+    def save(self):
+        """Adds the footer to the temp file and moves it to the final path"""
 
         # Check for minimal lenght
         if self.length > self.MIN_LEN:
 
             # Add length and universes to end of file
-            with open(self.TMP_PATH, 'a') as self.writer:
-                self.writer.write('!' + ','.join(str(u)
-                                  for u in self.universes) + " " + str(round(self.length*10**-6)) + "\n")
+            with open(self.part_path, 'a', newline='\n') as self.writer:
+                self.writer.write('!' + h.format_universes(self.universes) + " " + str(round(self.length*10**-6)) + "\n")
+                self.writer.flush()
+                fsync(self.writer.fileno())
 
             if self.compress:
                 # Compress file to final location
-                with open(self.TMP_PATH, 'rb') as tmp:
+                with open(self.part_path, 'rb') as tmp:
                     h.write_file(tmp.read(), self.final_path)
-                remove(self.TMP_PATH)
+                remove(self.part_path)
             
             else:
                 # Move file to final location
-                rename(self.TMP_PATH, self.final_path)
+                rename(self.part_path, self.final_path)
 
         else:
+            remove(self.part_path)
             print(h.bcolors.FAIL + "File must be longer than {} seconds, NOT SAVING.".format(
                 int(self.MIN_LEN*10**-9)) + h.bcolors.ENDC)
 
@@ -165,18 +346,38 @@ class ArtNetPlayback:
 
     halt = False  # Stop-thread flag
     i = 0  # Debug counter
+    library = None  # Index of the played directory
+    stats = None  # Live traffic counters
+
+    MERGE_MODES = ('htp', 'ltp')
+    SYNC_MODES = ('replay', 'frame')
+    SYNC_GAP = 2 * 10**6  # Pause in ns that ends a burst of packets
+    MERGE_INTERVAL = 22 * 10**6  # Min. time between merged output frames, Art-Net allows 44Hz
+    INDEX_INTERVAL = 10**9  # Seek points every second
 
     # Regex pattern for parsing a line
-    pattern = re.compile(
-        r"(?P<delay>[0-9]+)\s(?P<universe>[0-9]+)\s\[(?P<data>[0-9, ]*)\]")
+    pattern = h.LINE_PATTERN
 
-    def __init__(self, target_ip: str, filepath: Path, ShuffleLoop=False, debug: int = 0):
+    def __init__(self, target_ip: str, filepath: Path, ShuffleLoop=False, debug: int = 0, merge: str = None,
+                 chase: str = None, tc_type: int = 1, sync: str = None, profiler: StageProfiler = None,
+                 timer: PlaybackTimer = None, channels=None, precompile: bool = True, interpolate: float = None,
+                 hold: dict = None):
         """Initializes Replay function.
 
         Args:
         target_ip (str): IP of the ArtNet Server
-        filepath (Path): Path to the file or directory to replay
+        filepath (Path): Path to the file or directory to replay, or a list of files
         debug (int): n-th packet to print debug info
+        merge (str): 'htp' or 'ltp' to play all files at once as merged layers
+        chase (str): Chase ArtTimeCode, timecode "HH:MM:SS:FF" of the recordings start
+        tc_type (int): ArtTimeCode type of the chase timecode
+        sync (str): 'replay' recorded ArtSync packets or synthesize them per 'frame'
+        profiler (StageProfiler): Times the stages of the playback thread
+        timer (PlaybackTimer): Waits for the packets, default hybrid sleep and spin
+        channels (dict): Channel count per universe to send, 'auto' to analyze every file first
+        precompile (bool): Compile the files to packets in a worker process, else parse while sending
+        interpolate (float): Play faded frames at this rate in Hz instead of the recorded frames
+        hold (dict): Channels per universe that step instead of fading, see parse_hold
         """
 
         # Validate IP
@@ -186,8 +387,22 @@ class ArtNetPlayback:
             raise ValueError("Invalid IP address")
         self.target_ip = target_ip
 
+        if merge is not None and merge not in self.MERGE_MODES:
+            raise ValueError("Invalid merge mode, use one of {}".format(self.MERGE_MODES))
+        self.merge = merge
+        self.chase = timecode_to_ns(*parse_timecode(chase), tc_type) if chase is not None else None
+
+        if sync is not None and sync not in self.SYNC_MODES:
+            raise ValueError("Invalid sync mode, use one of {}".format(self.SYNC_MODES))
+        self.sync = sync
+        self.group = set()  # Universes sent since the last ArtSync
+
         # Create List of Filenames + directory variable
-        if filepath.name.endswith(('.artrec', '.rawrec')):
+        if isinstance(filepath, list):
+            self.dir = Path()
+            self.playlist = [str(f) for f in filepath]
+
+        elif filepath.name.endswith(('.artrec', '.rawrec')):
             self.dir = filepath.parent
             self.playlist = [filepath.name]
 
@@ -201,6 +416,17 @@ class ArtNetPlayback:
         # Instance variables
         self.debug = debug
         self.shuffle_loop = ShuffleLoop
+        self.profiler = profiler
+        self.timer = timer or PlaybackTimer()
+        self.channels = channels
+        self.precompile = precompile
+
+        if interpolate and (not precompile or merge or chase is not None):
+            raise ValueError("Interpolation needs the compiled playback, not --stream, --merge or --chase")
+        self.interpolate = interpolate
+        self.hold = hold
+        if interpolate and sync == 'replay':
+            self.sync = 'frame'  # Recorded ArtSync belongs to the recorded frames
 
         if self.debug:
             print(h.bcolors.OKBLUE + "----------playback----------\nAdress: {}\nFile: '{}' ".format(
@@ -208,6 +434,16 @@ class ArtNetPlayback:
 
     def get_artrec_files(self, path):
 
+        # Get all recordings from the index, only new or changed files are read
+        try:
+            self.library = RecordingLibrary(path)
+            self.library.update()
+            return self.library.files()
+
+        # Read-only directory, list it without index
+        except sqlite3.Error:
+            self.library = None
+
         # Get all files in current directory
         files = next(walk(path), (None, None, []))[2]
 
@@ -217,38 +453,92 @@ class ArtNetPlayback:
 
         return files
 
+    def channel_limits(self, paths: list):
+        """Returns the channel count per universe for Smartnet, the highest of all paths when analyzed
+
+        Args:
+            paths (list): Recordings that are played together
+        """
+        if self.channels != 'auto':
+            return self.channels
+
+        limits = dict()
+        for path in paths:
+            for universe, count in analyze_channels(path).items():
+                limits[universe] = max(count, limits.get(universe, 0))
+
+        if self.debug:
+            print("Channels in use: " + h.format_channels(limits))
+        return limits
+
+    def frame_sync(self, universe: int, delay: int, repeats: bool = True):
+        """Synthesizes ArtSync, sends it when the next packet starts a new burst
+
+        Args:
+            universe (int): Universe of the next packet
+            delay (int): Time in ns until the next packet
+            repeats (bool): A repeated universe starts a new burst
+        """
+        if self.group and (delay > self.SYNC_GAP or repeats and universe in self.group):
+            self.a.send_sync()
+            self.group.clear()
+
+        self.group.add(universe)
+
     def playback_thread(self, textfile):
 
-        self.last = time.time_ns()
+        timer = self.timer
+        timer.setup()
+        deadline = timer.now()  # Due time of the current line
+        carry = 0  # Delay of skipped lines
+        prof = self.profiler
 
         def send(m):
             """Send data over ArtNet through socket"""
             # prepare data
             data = bytearray(list(map(int, m.group('data').split(','))))
+            if prof: prof.lap('int convert')
 
-            # send data and set last timestamp
+            # send data
             self.a.send_data(data, int(m.group('universe')))
-            self.last = time.time_ns()
+
+        if prof: prof.mark()
 
         while textfile:
             # Get new line
             line = textfile.readline()
+            if prof: prof.lap('readline')
 
-            # Break at footer
-            if line[0] == "!" or self.halt:
+            # Break at footer, or at the end of a footerless recording
+            if not line or line[0] == "!" or self.halt:
                 break
 
-            # Apply regex pattern
+            # Apply regex pattern, header, checkpoints and a torn last line don't match
             match = self.pattern.match(line)
-
-            # Calculate time before packets must be sent
-            time_left = time.time_ns() - self.last - int(match.group('delay'))
-
-            # Wait, if time left before due is more than 0.5ms
-            if (time_left < -0.5 * 10**6):
-                time.sleep(abs(time_left)*10**-9)
-
-            send(match)
+            if match is None:
+                continue
+            delay = int(match.group('delay')) + carry
+            carry = 0
+            if prof: prof.lap('regex')
+
+            if match.group('sync'):
+                # Recorded ArtSync is only sent when replaying them
+                if self.sync != 'replay':
+                    carry = delay
+                    continue
+
+            elif self.sync == 'frame':
+                self.frame_sync(int(match.group('universe')), delay)
+
+            # Delays are relative to the due time of the last line, so timing errors don't add up
+            deadline += delay
+            time_left = timer.wait(deadline)
+            if prof: prof.lap('sleep')
+
+            if match.group('sync'):
+                self.a.send_sync()
+            else:
+                send(match)
 
             # Debug info every n-th packet
             if self.debug:
@@ -258,15 +548,368 @@ class ArtNetPlayback:
                     print("U: {}, Timing: {}ms".format(match.group(
                         'universe'), round(time_left * 10**-6, 6)))
                     self.i = 0
+            if prof: prof.lap('other')
+
+        # Latch the last burst
+        if self.group:
+            self.a.send_sync()
+            self.group.clear()
 
         # Close textfile after break
         textfile.close()
+        timer.finish()
+
+    def compiled_thread(self, compiled: CompiledRecording):
+        """Sends a compiled recording, only waits for the deadlines and sends
+
+        Args:
+            compiled (CompiledRecording): Packets and their deadlines from the worker
+        """
+        timer = self.timer
+        timer.setup()
+        prof = self.profiler
+        send = self.a.send_packet
+        stats = self.stats
+        base = None
+
+        for packets, ends, deadlines, universes in compiled.chunks():
+            if base is None:
+                base = timer.now()
+            packets = memoryview(packets)
+            start = 0
+            if prof: prof.mark()
+
+            for end, deadline, universe in zip(ends, deadlines, universes):
+                if self.halt:
+                    break
+
+                time_left = timer.wait(base + deadline)
+                if prof: prof.lap('sleep')
+
+                # Zero copy slice of the preassembled packet
+                send(packets[start:end])
+                if prof: prof.lap('sendto')
+
+                if universe != SYNC and stats:
+                    stats.count(universe, end - start - 18)
+                start = end
+
+                # Debug info every n-th packet
+                if self.debug:
+                    self.i += 1
+
+                    if self.i == self.debug:
+                        print("U: {}, Timing: {}ms".format(universe, round(time_left * 10**-6, 6)))
+                        self.i = 0
+                if prof:
+                    prof.lap('other')
+                    prof.packet()
+
+            packets.release()
+            if self.halt:
+                break
+
+        compiled.close()
+        timer.finish()
+
+    def merge_thread(self, textfiles: list):
+        """Plays all textfiles at once, merges them per universe and channel
+
+        The layers only update the merge, every universe that changed is sent
+        once per output frame: after a burst or when a layer starts its next
+        frame, at most every MERGE_INTERVAL.
+
+        Args:
+            textfiles (list): Opened recordings, one per layer
+        """
+
+        def tag(layer, textfile):
+            for offset, universe, data in h.read_packets(textfile):
+                yield offset, layer, universe, data
+
+        # Last buffer of every layer per universe and the merged output (LTP), in lanes
+        layers = [dict() for _ in textfiles]
+        merged = dict()
+        sizes = dict()  # Longest buffer per universe
+        pending = dict()  # (layer, universe) received since the last output frame
+
+        timer = self.timer
+        timer.setup()
+        start = timer.now()
+        last = 0
+        sent = -self.MERGE_INTERVAL  # Offset of the last output frame
+
+        def send_frame():
+            time_left = timer.wait(start + last)
+
+            for universe in dict.fromkeys(universe for layer, universe in pending):
+                if self.merge == 'htp':
+                    out = merge_htp([l[universe] for l in layers if universe in l])
+                else:
+                    out = merged[universe]
+                self.a.send_data(from_lanes(out, sizes[universe]), universe)
+
+                # Debug info every n-th packet
+                if self.debug:
+                    self.i += 1
+
+                    if self.i == self.debug:
+                        print("U: {}, Timing: {}ms".format(universe, round(time_left * 10**-6, 6)))
+                        self.i = 0
+
+            # Layers have their own bursts, ArtSync is synthesized for the merged output
+            if self.sync:
+                self.a.send_sync()
+            pending.clear()
+
+        # Packets of all layers in order of their offset
+        for offset, layer, universe, data in heapq.merge(*(tag(l, tf) for l, tf in enumerate(textfiles))):
+            if self.halt:
+                break
+
+            if pending and last - sent >= self.MERGE_INTERVAL and (
+                    offset - last > self.SYNC_GAP or (layer, universe) in pending):
+                send_frame()
+                sent = last
+
+            lanes = to_lanes(data)
+            if self.merge == 'ltp':
+                merged[universe] = merge_ltp(merged.get(universe, 0), layers[layer].get(universe, 0), lanes)
+            layers[layer][universe] = lanes
+            sizes[universe] = max(len(data), sizes.get(universe, 0))
+            pending[layer, universe] = None
+            last = offset
+
+        if pending and not self.halt:
+            send_frame()
+
+        for textfile in textfiles:
+            textfile.close()
+        timer.finish()
+
+    def build_index(self, textfile):
+        """Scans a binary opened recording once for seek points
+
+        Args:
+            textfile (BinaryIO): Opened recording
+
+        Returns:
+            list[tuple(int[offset in ns before the line], int[byte position of the line])]
+        """
+        index = []
+        offset = 0
+        pos = textfile.tell()
+        next_point = 0
+
+        for line in textfile:
+            if line[:1] == b'!':
+                break
+
+            split = line.find(b' ')
+            if line[:1].isdigit() and split > 0:
+                if offset >= next_point:
+                    index.append((offset, pos))
+                    next_point = offset + self.INDEX_INTERVAL
+
+                # Only the delay is needed, skip the regex
+                offset += int(line[:split])
+
+            pos += len(line)
+
+        return index or [(0, 0)]
+
+    def chase_seek(self, textfile, index, target: int):
+        """Seeks the textfile to the first packet due after target
+
+        Args:
+            textfile (BinaryIO): Opened recording
+            index (list): Seek points, see build_index
+            target (int): Position in ns
+
+        Returns:
+            tuple(int[offset in ns of the last skipped packet], dict[latest data of every universe])
+        """
+        offset, pos = index[max(bisect_right(index, (target, float('inf'))) - 1, 0)]
+        textfile.seek(pos)
+
+        snapshot = dict()
+        for line in iter(textfile.readline, b''):
+            match = self.pattern.match(line.decode())
+            if match is None:
+                if line[:1] == b'!':
+                    break
+                pos += len(line)
+                continue
+
+            if offset + int(match.group('delay')) > target:
+                break
+
+            offset += int(match.group('delay'))
+            if not match.group('sync'):
+                snapshot[int(match.group('universe'))] = match.group('data')
+            pos += len(line)
+
+        textfile.seek(pos)
+        return offset, snapshot
+
+    def chase_thread(self, textfile):
+        """Plays the textfile locked to the clock of the timecode chaser"""
+        index = self.build_index(textfile)
+
+        generation = None
+        offset = 0
+        first = False
+
+        while not self.halt:
+
+            # Seek requested by the chaser, send the look at the new position
+            if self.clock.generation != generation:
+                generation = self.clock.generation
+                offset, snapshot = self.chase_seek(textfile, index, self.clock.position())
+
+                for universe, data in snapshot.items():
+                    self.a.send_data(bytearray(map(int, data.split(','))), universe)
+
+                if snapshot and self.sync:
+                    self.a.send_sync()
+                    self.group.clear()
+
+                first = not snapshot
+                if snapshot:
+                    self.chaser.on_first_packet()
+                continue
+
+            pos = textfile.tell()
+            line = textfile.readline()
+
+            # End of recording, wait for a jump back
+            if not line or line[:1] == b'!':
+                textfile.seek(pos)
+                time.sleep(0.01)
+                continue
+
+            match = self.pattern.match(line.decode())
+            if match is None:
+                continue
+
+            due = offset + int(match.group('delay'))
+
+            if match.group('sync') and self.sync != 'replay':
+                offset = due
+                continue
+
+            elif self.sync == 'frame' and not match.group('sync'):
+                self.frame_sync(int(match.group('universe')), due - offset)
+
+            # Wait in short slices to follow seeks and rate changes
+            while not self.halt and self.clock.generation == generation:
+                time_left = due - self.clock.position()
+                if time_left < 0.5 * 10**6:
+                    break
+
+                rate = self.clock.rate
+                time.sleep(min(time_left / rate, 10**7) * 10**-9 if rate else 0.01)
+
+            if self.clock.generation != generation:
+                continue
+
+            offset = due
+            if match.group('sync'):
+                self.a.send_sync()
+                continue
+
+            self.a.send_data(bytearray(map(int, match.group('data').split(','))), int(match.group('universe')))
+
+            if first:
+                self.chaser.on_first_packet()
+                first = False
+
+        textfile.close()
+
+    def start_chase(self):
+        """Starts the chase thread for the first file of the playlist"""
+        path = Path(self.dir, self.playlist[0])
+
+        self.duration, self.universes = self.get_footer_info(path)
+        self.a = Smartnet(self.target_ip, self.universes, 40, channels=self.channel_limits([path]))
+        self.a.stats = self.stats = TrafficStats()
+
+        # Clock stands still until timecode is received
+        self.clock = PlaybackClock(rate=0)
+        self.chaser = TimecodeChaser(self.clock, self.chase)
+
+        self.server = SmartNetServer()
+        self.server.register_timecode_listener(self.chaser.on_timecode)
+
+        # Needs a seekable binary file
+        textfile = open(h.unzip_file(path) if path.suffix == '.artrec' else path, 'rb')
+
+        print(h.bcolors.OKGREEN + "Chasing timecode with '{}'...".format(path.name) + h.bcolors.ENDC)
+
+        self.worker = threading.Thread(target=self.chase_thread, args=(textfile,))
+        self.worker.start()
+
+        dashboard = Dashboard(self.stats)
+        while self.worker.is_alive():
+            self.chaser.check_freewheel()
+            dashboard.show(self.chaser.status())
+            time.sleep(0.2)
+
+    def wait_for_worker(self):
+        """Shows the live status until the worker thread is finished"""
+        dashboard = Dashboard(self.stats)
+        while self.worker.is_alive():
+            remaining = round(
+                ((self.duration * 10**6) - (time.time_ns() - self.start)) * 10**-9, 1)
+            # refresh remaining time
+            if remaining > 0:
+                dashboard.show("Remaining %.1fs" % remaining)
+            else:
+                dashboard.show("Playing last frames...")
+            time.sleep(0.2)
+
+        print('Finished!')
+
+    def start_merge(self):
+        """Starts the merge thread with every file of the playlist as a layer"""
+        print(h.bcolors.OKGREEN + "Merging {} files ({})...".format(
+            len(self.playlist), self.merge.upper()) + h.bcolors.ENDC)
+
+        paths = [Path(self.dir, artrec) for artrec in self.playlist]
+
+        # Longest file and all universes of all files
+        self.duration, self.universes = 0, set()
+        for path in paths:
+            duration, universes = self.get_footer_info(path)
+            self.duration = max(self.duration, duration)
+            self.universes.update(universes)
+
+        self.a = Smartnet(self.target_ip, list(self.universes), 40, channels=self.channel_limits(paths))
+        self.a.stats = self.stats = TrafficStats()
+
+        self.start = time.time_ns()
+        self.worker = threading.Thread(
+            target=self.merge_thread, args=([h.open_recording(p) for p in paths],))
+        self.worker.start()
+
+        self.wait_for_worker()
 
     def start_playback(self):
         """Starts the playback thread"""
         try:
 
-            if self.playlist != []:
+            if self.playlist != [] and self.chase is not None:
+                self.start_chase()
+
+            elif self.playlist != [] and self.merge:
+                self.start_merge()
+                self.timer.report()
+
+                if self.shuffle_loop:
+                    print(h.bcolors.PINK + "Repeating..." + h.bcolors.ENDC)
+                    self.start_playback()
+
+            elif self.playlist != []:
 
                 for i, artrec in enumerate(self.playlist):
 
@@ -283,34 +926,36 @@ class ArtNetPlayback:
                     self.duration, self.universes = self.get_footer_info(path)
 
                     # Create Smartnet instance
-                    self.a = Smartnet(self.target_ip, self.universes, 40)
-
-                    # Open file
-                    # Unzips if file is zipped
-                    if path.suffix == '.artrec':
-                        textfile = open(h.unzip_file(path), 'r')
-                    elif path.suffix == '.rawrec':
-                        textfile = open(path, 'r')
+                    self.a = Smartnet(self.target_ip, self.universes, 40, channels=self.channel_limits([path]))
+                    self.a.profiler = self.profiler
+                    self.a.stats = self.stats = TrafficStats()
+
+                    if self.precompile:
+                        # Parsing runs in the worker process, ahead of the sending thread
+                        target = self.compiled_thread
+                        args = (CompiledRecording(path, self.a.channels, self.sync, self.SYNC_GAP,
+                                                  self.interpolate, self.hold),)
+
+                    else:
+                        # Open file
+                        # Unzips if file is zipped
+                        target = self.playback_thread
+                        if path.suffix == '.artrec':
+                            args = (open(h.unzip_file(path), 'r'),)
+                        elif path.suffix == '.rawrec':
+                            args = (open(path, 'r'),)
 
                     # Start thread
                     self.worker = threading.Thread(
-                        target=self.playback_thread, args=(textfile,))
+                        target=self.profiler.wrap(target) if self.profiler else target, args=args)
                     self.worker.start()
 
                     # Print remaining time
-                    while self.worker.is_alive():
-                        remaining = round(
-                            ((self.duration * 10**6) - (time.time_ns() - self.start)) * 10**-9, 1)
-                        # refresh remaining time
-                        if remaining > 0:
-                            sys.stdout.write("\r%.1fs" % remaining)
-                            sys.stdout.flush()
-                        else:
-                            sys.stdout.write("\rPlaying last frames...")
-                            sys.stdout.flush()
-                        time.sleep(0.2)
-
-                    print('\nFinished!')
+                    self.wait_for_worker()
+
+                if self.profiler:
+                    self.profiler.report()
+                self.timer.report()
 
                 if self.shuffle_loop:
                     print(h.bcolors.PINK +
@@ -325,6 +970,10 @@ class ArtNetPlayback:
         # User abort
         except KeyboardInterrupt:
             self.close()
+
+            if self.profiler:
+                self.profiler.report()
+            self.timer.report()
             print("\n\nTERMINATED BY USER, Stopping playback.\n")
 
     def close(self):
@@ -333,12 +982,23 @@ class ArtNetPlayback:
         self.worker.join()
         self.a.close()
 
+        if self.chase is not None:
+            self.server.listen = False
+            print()
+            self.chaser.report()
+
     def get_footer_info(self, filepath):
         """Opens the file in binary to look for last line (faster)
 
         Returns:
             tuple(int[duration in ms], list[int(universes)])
         """
+        # Cached in the library index
+        if self.library is not None and filepath.parent == self.library.dir:
+            info = self.library.info(filepath.name)
+            if info is not None:
+                return info
+
         # Unzips if file is zipped
         if filepath.suffix == '.artrec':
             tf = open(h.unzip_file(filepath), 'rb')
@@ -354,8 +1014,13 @@ class ArtNetPlayback:
         except OSError:
             tf.seek(0)
 
-        last_line_info = tf.readline().decode().replace('!', '').split(' ')
-
+        last_line = tf.readline().decode(errors='replace')
         tf.close()
 
-        return int(last_line_info[1]), list(map(int, last_line_info[0].split(',')))
+        # No footer, the recording was not stopped cleanly
+        if not last_line.startswith('!'):
+            print(h.bcolors.WARNING + "'{}' has no footer, see --mode recover.".format(filepath.name) + h.bcolors.ENDC)
+            return RecoveryInfo(Path(tf.name)).footer_info()
+
+        last_line_info = last_line.replace('!', '').split(' ')
+        return int(last_line_info[1]), h.parse_universes(last_line_info[0])
@@ -0,0 +1,218 @@
+#!/usr/bin/env python
+"""Microbenchmarks of the per packet CPU work of record and playback.
+
+Usage: benchmark.py [--save] [--baseline file.json] [--tolerance 20]
+
+Every case is a fixed synthetic recording (seeded), so runs are comparable.
+Record runs the receive callback of ArtNetRecord (line formatting and
+checkpoints), play the parsing playback thread of ArtNetPlayback (regex,
+int conversion, assembling and sending the ArtDmx packet to 127.0.0.1).
+
+Times are not compared as they are, they depend on the machine and its
+load. Every run of a case is paired with a fixed reference workload right
+before it, the median of the ratios over REPEATS is the cost of the case.
+The baseline stores these costs. It is not part of the repository, store
+one with --save on the code before a change, then compare the change.
+"""
+
+import contextlib
+import getopt
+import gzip
+import io
+import json
+import random
+import statistics
+import sys
+import tempfile
+import time
+
+from pathlib import Path
+from types import SimpleNamespace
+
+# local imports
+import helpfunctions as h
+from artnet_tools import ArtNetPlayback, ArtNetRecord
+from smartnet import Smartnet
+from timer import PlaybackTimer
+
+BASELINE = Path(__file__).with_name('bench_baseline.json')
+PACKETS = 3000  # Per case
+REPEATS = 7  # Median of, single runs are noisy
+REFERENCE = [[(i + c) % 256 for c in range(512)] for i in range(200)]  # Formatted and parsed by the reference workload
+
+
+def make_frames(universes: int, density: str, seed: int = 1):
+    """Returns (universe, data) of PACKETS synthetic packets, data is a list like SmartNetServer passes it
+
+    Args:
+        universes (int): Universes per frame
+        density (str): 'full' random 512 channels, 'sparse' 48 random channels and zeros,
+                       'static' the same 512 values in every frame
+    """
+    rng = random.Random(seed)
+    static = [rng.randrange(256) for _ in range(512)]
+    packets = []
+    while len(packets) < PACKETS:
+        for u in range(universes):
+            if density == 'full':
+                data = [rng.randrange(256) for _ in range(512)]
+            elif density == 'sparse':
+                data = [rng.randrange(256) for _ in range(48)] + [0] * 464
+            else:
+                data = static
+            packets.append((u, data))
+    return packets[:PACKETS]
+
+
+def reference():
+    """Fixed pure Python workload, formats and parses DMX like lines"""
+    for data in REFERENCE:
+        bytearray(map(int, str(data)[1:-1].split(',')))
+
+
+def cost_of(function):
+    """Returns the median time of function in reference runs and the best time in seconds"""
+    ratios, best = [], None
+    for _ in range(REPEATS):
+        start = time.perf_counter()
+        reference()
+        middle = time.perf_counter()
+        function()
+        end = time.perf_counter()
+
+        ratios.append((end - middle) / (middle - start))
+        best = end - middle if best is None else min(best, end - middle)
+    return statistics.median(ratios), best
+
+
+def make_recorder(universes: int):
+    """Returns an ArtNetRecord ready for its receive callback, writing to memory"""
+    with contextlib.redirect_stdout(io.StringIO()):
+        rec = ArtNetRecord(list(range(universes)), 0, Path(tempfile.gettempdir(), 'benchmark.rawrec'))
+
+    # The state record() sets up, the server only provides the receive time
+    rec.a = SimpleNamespace(packet_time=0)
+    rec.start = rec.last = 0
+    rec.packets = 0
+    rec.segment_crc = rec.segment_size = 0
+    rec.next_checkpoint = rec.checkpoint_interval
+    return rec
+
+
+def run_case(universes: int, density: str):
+    """Measures one case
+
+    Returns:
+        dict: record and play cost and packets/s, bytes per packet of .rawrec and .artrec
+    """
+    packets = make_frames(universes, density)
+    delay = 22727272 // universes  # 44Hz
+    callback = make_recorder(universes)._ArtNetRecord__callback
+
+    def record():
+        rec = callback.__self__
+        rec.writer = io.StringIO()
+        rec.a.packet_time = rec.last
+        for universe, data in packets:
+            rec.a.packet_time += delay
+            callback(data, universe)
+        return rec.writer.getvalue()
+
+    record_cost, record_time = cost_of(record)
+    text = record()
+
+    # Recorded delays are replaced by 0, all packets are due at once and only the parsing is timed
+    stream = ''.join('0' + line[line.index(' '):] for line in text.splitlines(True) if line[0] != '#')
+    player = ArtNetPlayback('127.0.0.1', Path('benchmark.rawrec'), precompile=False, timer=PlaybackTimer('sleep'))
+    player.a = Smartnet('127.0.0.1', list(range(universes)))
+
+    def play():
+        player.playback_thread(io.StringIO(stream))
+
+    play_cost, play_time = cost_of(play)
+    player.a.close()
+
+    return {
+        'record': round(record_cost, 3),
+        'play': round(play_cost, 3),
+        'record_pps': round(len(packets) / record_time),
+        'play_pps': round(len(packets) / play_time),
+        'rawrec': round(len(text) / len(packets), 1),
+        'artrec': round(len(gzip.compress(text.encode(), compresslevel=9)) / len(packets), 1),
+    }
+
+
+def run_all():
+    results = dict()
+    for universes in (1, 16, 64):
+        for density in ('full', 'sparse', 'static'):
+            results["{}u-{}".format(universes, density)] = run_case(universes, density)
+    return results
+
+
+def compare(results: dict, baseline: dict, tolerance: float):
+    """Prints the results next to the baseline, costs and sizes are compared
+
+    Returns:
+        int: Number of regressions
+    """
+    regressions = 0
+    print(h.bcolors.OKBLUE + "{:<12} {:>10} {:>8} {:>8} {:>10} {:>8} {:>8} {:>10} {:>8} {:>10} {:>8}".format(
+        "Case", "Record pk/s", "cost", "vs base", "Play pk/s", "cost", "vs base",
+        "Raw B/pk", "vs base", "Gzip B/pk", "vs base") + h.bcolors.ENDC)
+
+    for name, result in results.items():
+        base = baseline.get(name, dict())
+        line = "{:<12}".format(name)
+
+        for key, shown in (('record', 'record_pps'), ('play', 'play_pps'), ('rawrec', None), ('artrec', None)):
+            change, regressed = '', False
+            if base.get(key):
+                # Lower is better for costs and sizes
+                worse = (result[key] / base[key] - 1) * 100
+                change, regressed = "{:+.0f}%".format(worse), worse > tolerance
+                regressions += regressed
+
+            if shown:
+                text = "{:>10} {:>8} {:>8}".format(result[shown], result[key], change)
+            else:
+                text = "{:>10} {:>8}".format(result[key], change)
+            line += " " + (h.bcolors.FAIL + text + h.bcolors.ENDC if regressed else text)
+        print(line)
+
+    return regressions
+
+
+def main(argv):
+    baseline_path = BASELINE
+    save = False
+    tolerance = 20.0
+
+    opts, args = getopt.getopt(argv, "", ["save", "baseline=", "tolerance="])
+    for opt, arg in opts:
+        if opt == "--save":
+            save = True
+        elif opt == "--baseline":
+            baseline_path = Path(arg)
+        elif opt == "--tolerance":
+            tolerance = float(arg)
+
+    results = run_all()
+    baseline = json.loads(baseline_path.read_text()) if baseline_path.exists() else dict()
+    regressions = compare(results, baseline, tolerance)
+
+    if save:
+        baseline_path.write_text(json.dumps(results, indent=2) + "\n")
+        print("Baseline saved to '{}'".format(baseline_path))
+    elif not baseline:
+        print(h.bcolors.WARNING + "No baseline yet, store one with --save." + h.bcolors.ENDC)
+    elif regressions:
+        print(h.bcolors.FAIL + "{} regressions over {}%".format(regressions, tolerance) + h.bcolors.ENDC)
+        return 1
+    else:
+        print(h.bcolors.OKGREEN + "No regressions over {}%".format(tolerance) + h.bcolors.ENDC)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
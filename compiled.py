@@ -0,0 +1,170 @@
+#!/usr/bin/env python
+import os
+import queue
+import signal
+import threading
+
+from array import array
+from multiprocessing import Process, Queue
+from pathlib import Path
+
+# local imports
+import helpfunctions as h
+from interpolate import FrameInterpolator
+from smartnet import Smartnet
+
+SYNC = 0xFFFF  # Universe of ArtSync packets
+FIRST_CHUNK = 256  # Packets, small so playback starts right away
+CHUNK = 4096  # Packets
+LOOKAHEAD = 8  # Chunks compiled ahead of playback, bounds the memory
+NICE = 10  # Priority of the worker below the playback, without SCHED_IDLE
+
+
+def compile_worker(path: Path, channels: dict, sync: str, sync_gap: int, chunks: Queue,
+                   interpolate: float = None, hold: dict = None):
+    """Worker process, parses a text recording into chunks of ready to send packets.
+
+    A chunk is (bytes[packets back to back], array[end of every packet],
+    array[deadline in ns since the start], array[universe, SYNC for ArtSync]),
+    None ends the recording.
+
+    Args:
+        path (Path): .artrec or .rawrec file
+        channels (dict): Channel count per universe, see Smartnet
+        sync (str): 'replay' recorded ArtSync or synthesize it per 'frame', None for no ArtSync
+        sync_gap (int): Pause in ns that ends a burst of packets (frame)
+        chunks (Queue): Output of the chunks
+        interpolate (float): Output rate of faded frames in Hz, None plays the recorded frames
+        hold (dict): Channels per universe that are not faded, see parse_hold
+    """
+    # Ctrl+C is handled by the playback, which stops the worker
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+    # Runs ahead, the sending thread gets the CPU first
+    try:
+        os.sched_setscheduler(0, os.SCHED_IDLE, os.sched_param(0))
+    except (AttributeError, OSError):
+        # Not on Windows, the worker runs with normal priority there
+        try:
+            os.nice(NICE)
+        except (AttributeError, OSError):
+            pass
+
+    a = Smartnet('127.0.0.1', [], channels=channels)
+    a.close()  # Only assembles packets
+    sync_packet = bytes(a.sync_packet)
+
+    packets, ends, deadlines, universes = bytearray(), array('L'), array('q'), array('H')
+    size = FIRST_CHUNK
+
+    def add(offset, packet, universe):
+        nonlocal packets, ends, deadlines, universes, size
+        packets += packet
+        ends.append(len(packets))
+        deadlines.append(offset)
+        universes.append(universe)
+
+        if len(ends) >= size:
+            chunks.put((bytes(packets), ends, deadlines, universes))
+            packets, ends, deadlines, universes = bytearray(), array('L'), array('q'), array('H')
+            size = CHUNK
+
+    group = set()  # Universes since the last synthesized ArtSync
+    last = 0
+
+    with h.open_recording(path) as textfile:
+        # Faded frames get their ArtSync per frame, the recorded ones don't fit them
+        frames = h.read_packets(textfile, sync=sync == 'replay' and not interpolate)
+        if interpolate:
+            frames = FrameInterpolator(interpolate, hold).frames(frames)
+
+        for offset, universe, data in frames:
+            if universe is None:
+                add(offset, sync_packet, SYNC)
+                continue
+
+            # Same rule as ArtNetPlayback.frame_sync
+            if sync == 'frame':
+                if group and (offset - last > sync_gap or universe in group):
+                    # Latches the burst it closes, right after its last packet
+                    add(last, sync_packet, SYNC)
+                    group.clear()
+                group.add(universe)
+                last = offset
+
+            add(offset, a.make_packet(data, universe), universe)
+
+    # Latch the last burst
+    if group:
+        add(last, sync_packet, SYNC)
+
+    if ends:
+        chunks.put((bytes(packets), ends, deadlines, universes))
+    chunks.put(None)
+
+
+class CompiledRecording:
+    """A text recording compiled to packets by a worker process while it plays.
+
+    The worker does all parsing and packet assembly, a prefetch thread
+    takes its chunks, so the playback thread only waits and sends. At most
+    LOOKAHEAD chunks are held, long recordings don't have to fit in memory.
+    """
+
+    def __init__(self, path: Path, channels: dict = None, sync: str = None, sync_gap: int = 2 * 10**6,
+                 interpolate: float = None, hold: dict = None):
+        """Starts compiling.
+
+        Args:
+            path (Path): .artrec or .rawrec file
+            channels (dict): Channel count per universe, see Smartnet
+            sync (str): 'replay' recorded ArtSync or synthesize it per 'frame'
+            sync_gap (int): Pause in ns that ends a burst of packets
+            interpolate (float): Output rate of faded frames in Hz, None plays the recorded frames
+            hold (dict): Channels per universe that are not faded
+        """
+        self.path = path
+        self.halt = False
+        self.compiled = queue.Queue(maxsize=2)
+
+        self.worker_queue = Queue(maxsize=LOOKAHEAD)
+        self.worker = Process(target=compile_worker, daemon=True,
+                              args=(path, channels, sync, sync_gap, self.worker_queue, interpolate, hold))
+        self.worker.start()
+
+        self.prefetch = threading.Thread(target=self.prefetch_thread, daemon=True)
+        self.prefetch.start()
+
+    def prefetch_thread(self):
+        """Takes the chunks from the worker before they are due"""
+        while not self.halt:
+            try:
+                chunk = self.worker_queue.get(timeout=0.5)
+            except queue.Empty:
+                if not self.worker.is_alive():
+                    print(h.bcolors.FAIL + "Compiling '{}' failed.".format(self.path.name) + h.bcolors.ENDC)
+                    chunk = None
+                else:
+                    continue
+
+            self.compiled.put(chunk)
+            if chunk is None:
+                return
+
+    def chunks(self):
+        """Generator over the compiled chunks in order, waits for the worker if it fell behind"""
+        while not self.halt:
+            try:
+                chunk = self.compiled.get(timeout=0.5)
+            except queue.Empty:
+                continue
+            if chunk is None:
+                return
+            yield chunk
+
+    def close(self):
+        """Stops the worker"""
+        self.halt = True
+        if self.worker.is_alive():
+            self.worker.terminate()
+        self.worker.join()
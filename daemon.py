@@ -0,0 +1,250 @@
+#!/usr/bin/env python
+import socket
+import threading
+import time
+
+from array import array
+from bisect import bisect_left
+from pathlib import Path
+
+# local imports
+import helpfunctions as h
+from smartnet import Smartnet
+from timecode import PlaybackClock
+
+
+class Cue:
+    """A recording preloaded into ready to send packets."""
+
+    def __init__(self, path: Path, a: Smartnet):
+        """Parses the whole recording once.
+
+        Args:
+            path (Path): .artrec or .rawrec file
+            a (Smartnet): Client used to assemble the packets
+        """
+        self.name = path.stem
+        self.offsets = array('q')  # Offset in ns of every packet
+        self.universes = array('H')
+        self.packets = []
+
+        with h.open_recording(path) as textfile:
+            for offset, universe, data in h.read_packets(textfile):
+                self.offsets.append(offset)
+                self.universes.append(universe)
+                self.packets.append(bytes(a.make_packet(data, universe)))
+
+        self.start = self.offsets[0] if self.offsets else 0  # Offset of the first packet
+        self.duration = self.offsets[-1] if self.offsets else 0
+
+    def snapshot(self, i: int):
+        """Returns the latest packet of every universe before packet i"""
+        latest = dict()
+        remaining = set(self.universes)
+        while i > 0 and remaining:
+            i -= 1
+            if self.universes[i] in remaining:
+                remaining.discard(self.universes[i])
+                latest[self.universes[i]] = self.packets[i]
+        return list(latest.values())
+
+
+class ArtNetDaemon:
+    """Long running player, preloads cues and takes commands over UDP.
+
+    Commands (one per datagram, the reply goes back to the sender):
+        play <cue> [seconds]   start a cue, optionally at a position
+        stop                   stop the playing cue
+        seek <seconds>         jump within the playing cue
+        rate <factor>          playback speed, 0 pauses
+        list                   preloaded cues
+        status                 position, rate and trigger latency
+    """
+
+    CONTROL_PORT = 7777
+
+    def __init__(self, target_ip: str, filepath: Path, port: int = CONTROL_PORT, debug: int = 0):
+        """Initializes the daemon and preloads all recordings.
+
+        Args:
+            target_ip (str): IP of the Art-Net receiver
+            filepath (Path): Recording or directory of recordings to preload
+            port (int): Local UDP port for commands
+        """
+        self.a = Smartnet(target_ip, [])
+        self.port = port
+        self.debug = debug
+
+        paths = [filepath] if filepath.is_file() else sorted(
+            p for p in filepath.iterdir() if p.suffix in ('.artrec', '.rawrec'))
+
+        print(h.bcolors.OKBLUE + "----------daemon----------\nAdress: {}\nControl: udp://127.0.0.1:{}".format(
+            target_ip, port) + h.bcolors.ENDC)
+
+        self.cues = dict()
+        for path in paths:
+            start = time.perf_counter()
+            cue = Cue(path, self.a)
+            self.cues[cue.name] = cue
+            print("Preloaded '{}': {} packets, {:.1f}s in {:.2f}s".format(
+                cue.name, len(cue.packets), cue.duration * 10**-9, time.perf_counter() - start))
+
+        # Playback state (cue, clock, perf_counter_ns of the command), replaced as one tuple by the control thread
+        self.state = (None, PlaybackClock(rate=0), None)
+        self.latencies = []
+
+        self.halt = False
+        self.wake = threading.Event()
+        self.worker = threading.Thread(target=self.playback_thread, daemon=True)
+
+    def playback_thread(self):
+        """Sends the packets of the current cue on the clock"""
+        state = None
+        command_time = None  # Of the state, until its first packet
+
+        while not self.halt:
+            # New cue or seek, continue at the clock position with the current look
+            if self.state is not state:
+                state = self.state
+                cue, clock, command_time = state
+
+                if cue is not None:
+                    i = bisect_left(cue.offsets, clock.position())
+                    snapshot = cue.snapshot(i)
+                    for packet in snapshot:
+                        self.a.send_packet(packet)
+
+                    # Without a snapshot the latency runs until the next packet
+                    if snapshot:
+                        self.first_packet(command_time)
+                        command_time = None
+
+            # Idle or at the end of the cue until the next command
+            if cue is None or i >= len(cue.packets):
+                self.wake.wait(0.5)
+                self.wake.clear()
+                continue
+
+            time_left = cue.offsets[i] - clock.position()
+
+            # Wait, if time left before due is more than 0.5ms, commands wake up early
+            if time_left > 0.5 * 10**6:
+                rate = clock.rate
+                self.wake.wait(min(time_left / rate * 10**-9, 0.5) if rate else 0.5)
+                self.wake.clear()
+                continue
+
+            self.a.send_packet(cue.packets[i])
+            self.first_packet(command_time)
+            command_time = None
+            i += 1
+
+    def first_packet(self, command_time: int):
+        """Measures command to first packet latency
+
+        Args:
+            command_time (int): perf_counter_ns of the command, None if already measured
+        """
+        if command_time is not None:
+            self.latencies.append(time.perf_counter_ns() - command_time)
+
+            if self.debug:
+                print("Latency: {:.3f}ms".format(self.latencies[-1] * 10**-6))
+
+    def command(self, line: str, received: int):
+        """Executes a command, returns the reply
+
+        Args:
+            line (str): Command line
+            received (int): perf_counter_ns when the command was received
+        """
+        args = line.split()
+        if not args:
+            return "ERROR empty command"
+        cmd = args[0].lower()
+        cue, clock, _ = self.state
+
+        if cmd == 'play':
+            if len(args) < 2 or args[1] not in self.cues:
+                return "ERROR unknown cue"
+            cue = self.cues[args[1]]
+
+            # From the first packet, the lead-in of the recording would delay every trigger
+            position = int(float(args[2]) * 10**9) if len(args) > 2 else cue.start
+            self.state = (cue, PlaybackClock(position), received)
+
+        elif cmd == 'stop':
+            self.state = (None, clock, None)
+
+        elif cmd == 'seek':
+            # A new clock, the playback thread never sees the old cue at the new position
+            self.state = (cue, PlaybackClock(int(float(args[1]) * 10**9), clock.rate), received)
+
+        elif cmd == 'rate':
+            rate = float(args[1])
+            if rate < 0:
+                return "ERROR rate must not be negative"
+            clock.set_rate(rate)
+
+        elif cmd == 'list':
+            return "OK " + " ".join(self.cues)
+
+        elif cmd == 'status':
+            return "OK " + self.status()
+
+        else:
+            return "ERROR unknown command"
+
+        # Playback thread picks up the new state right away
+        self.wake.set()
+        return "OK"
+
+    def status(self):
+        """Returns a one line status string"""
+        cue, clock, _ = self.state
+        state = "stopped"
+        if cue is not None:
+            state = "{} {:.1f}/{:.1f}s rate {}".format(
+                cue.name, min(clock.position(), cue.duration) * 10**-9, cue.duration * 10**-9, clock.rate)
+
+        if self.latencies:
+            state += " | latency last {:.3f}ms avg {:.3f}ms max {:.3f}ms".format(
+                self.latencies[-1] * 10**-6, sum(self.latencies) / len(self.latencies) * 10**-6,
+                max(self.latencies) * 10**-6)
+        return state
+
+    def run(self):
+        """Serves commands until Ctrl+C"""
+        control = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        control.bind(('127.0.0.1', self.port))
+        control.settimeout(0.5)
+
+        self.worker.start()
+        print(h.bcolors.OKGREEN + "Ready for commands." + h.bcolors.ENDC)
+
+        try:
+            while True:
+                try:
+                    data, address = control.recvfrom(1024)
+                except socket.timeout:
+                    continue
+                received = time.perf_counter_ns()
+
+                try:
+                    reply = self.command(data.decode().strip(), received)
+                except (ValueError, IndexError) as e:
+                    reply = "ERROR {}".format(e)
+
+                control.sendto(reply.encode(), address)
+
+        except KeyboardInterrupt:
+            print("\n\nTERMINATED BY USER, Stopping daemon.\n")
+
+        if self.latencies:
+            print(self.status())
+
+        self.halt = True
+        self.wake.set()
+        self.worker.join()
+        control.close()
+        self.a.close()
@@ -0,0 +1,166 @@
+#!/usr/bin/env python
+import sys
+import time
+
+# local imports
+import helpfunctions as h
+
+
+class TrafficStats:
+    """Per universe counters, updated from the hot path.
+
+    Only one thread writes the counters and the dashboard only reads them,
+    so no lock is needed, a slightly stale read just shows up next refresh.
+    """
+
+    def __init__(self):
+        self.universes = dict()  # universe -> [packets, bytes, last seen ns, frame interval ns]
+        self.written = 0  # Bytes handed to the file writer
+
+    def count(self, universe: int, size: int):
+        """Counts one packet of universe with size bytes of DMX data"""
+        now = time.monotonic_ns()
+        counter = self.universes.get(universe)
+        if counter is None:
+            self.universes[universe] = [1, size, now, 0]
+            return
+
+        counter[0] += 1
+        counter[1] += size
+        # Smoothed frame interval, integer EMA with factor 1/8
+        counter[3] += (now - counter[2] - counter[3]) >> 3
+        counter[2] = now
+
+
+class SourceStats:
+    """Per sender counters of a server socket, same threading as TrafficStats."""
+
+    def __init__(self):
+        self.sources = dict()  # IP -> [packets, bytes, universes]
+        self.rejected = dict()  # IP -> packets, only counted when the kernel doesn't filter
+
+    def count(self, source: str, universe: int, size: int):
+        """Counts one accepted packet of source, universe is None for other packets than ArtDmx"""
+        counter = self.sources.get(source)
+        if counter is None:
+            counter = self.sources[source] = [0, 0, set()]
+
+        counter[0] += 1
+        counter[1] += size
+        if universe is not None:
+            counter[2].add(universe)
+
+    def reject(self, source: str):
+        """Counts one packet of a source that is not allowed"""
+        self.rejected[source] = self.rejected.get(source, 0) + 1
+
+    def shared_universes(self):
+        """Returns the universes received from more than one source, their streams are interleaved"""
+        seen, shared = set(), set()
+        for packets, size, universes in list(self.sources.values()):
+            shared |= seen & universes
+            seen |= universes
+        return shared
+
+    def report(self):
+        """Prints the counters of every source"""
+        print(h.bcolors.OKBLUE + "----------sources----------" + h.bcolors.ENDC)
+        for source, (packets, size, universes) in sorted(self.sources.items()):
+            print("{:<15} {:>9} packets {:>10.1f} kB  universes {}".format(
+                source, packets, size * 10**-3, h.format_universes(universes) or "-"))
+        for source, packets in sorted(self.rejected.items()):
+            print(h.bcolors.WARNING + "{:<15} {:>9} packets rejected".format(source, packets) + h.bcolors.ENDC)
+
+        shared = self.shared_universes()
+        if shared:
+            print(h.bcolors.FAIL + "Universes {} were received from several sources.".format(
+                h.format_universes(shared)) + h.bcolors.ENDC)
+
+
+class Dashboard:
+    """Compact live status view, redrawn in place every refresh."""
+
+    MAX_ROWS = 16  # Universes shown, the busiest first
+
+    def __init__(self, stats: TrafficStats, disk=None, backlog=None, sources: SourceStats = None):
+        """Initializes the dashboard.
+
+        Args:
+            stats (TrafficStats): Counters to show
+            disk (callable): Returns the bytes on disk of the output, if recording
+            backlog (callable): Returns a string with the writer backlog, if recording
+            sources (SourceStats): Senders of the received packets, if recording
+        """
+        self.stats = stats
+        self.disk = disk
+        self.backlog = backlog
+        self.sources = sources
+
+        self.lines = 0  # Printed lines of the last refresh
+        self.last_time = time.monotonic_ns()
+        self.last_counts = dict()
+        self.last_disk = 0
+
+    def show(self, status: str):
+        """Redraws the dashboard
+
+        Args:
+            status (str): First line, e.g. elapsed or remaining time
+        """
+        now = time.monotonic_ns()
+        dt = max(now - self.last_time, 1) * 10**-9
+        self.last_time = now
+
+        rows = []
+        total_packets = total_bytes = 0
+        for universe, (packets, size, seen, interval) in list(self.stats.universes.items()):
+            last_packets, last_size = self.last_counts.get(universe, (0, 0))
+            self.last_counts[universe] = (packets, size)
+
+            rate = (packets - last_packets) / dt
+            total_packets += rate
+            total_bytes += (size - last_size) / dt
+            rows.append((-rate, universe, (size - last_size) / dt, (now - seen) * 10**-6, interval * 10**-6))
+
+        lines = [h.bcolors.BOLD + status + h.bcolors.ENDC]
+        summary = "{} universes | {:.0f} pkt/s | {:.1f} kB/s".format(len(rows), total_packets, total_bytes * 10**-3)
+
+        if self.disk is not None:
+            disk = self.disk()
+            summary += " | file {:.2f} MB, +{:.1f} kB/s".format(
+                disk * 10**-6, (disk - self.last_disk) / dt * 10**-3)
+            self.last_disk = disk
+        if self.backlog is not None:
+            summary += " | backlog " + self.backlog()
+        if self.sources is not None:
+            summary += " | {} sources".format(len(self.sources.sources))
+            rejected = sum(list(self.sources.rejected.values()))
+            if rejected:
+                summary += ", {} pkt rejected".format(rejected)
+        lines.append(summary)
+
+        if self.sources is not None:
+            shared = self.sources.shared_universes()
+            if shared:
+                lines.append(h.bcolors.FAIL + "Universes {} from several sources!".format(
+                    h.format_universes(shared)) + h.bcolors.ENDC)
+
+        lines.append(h.bcolors.OKBLUE + "{:>9} {:>8} {:>9} {:>9} {:>10}".format(
+            "Universe", "pkt/s", "kB/s", "age ms", "frame ms") + h.bcolors.ENDC)
+
+        rows.sort()
+        for rate, universe, size, age, interval in rows[:self.MAX_ROWS]:
+            color = h.bcolors.FAIL if age > 1000 else ''
+            lines.append(color + "{:>9} {:>8.1f} {:>9.2f} {:>9.0f} {:>10.2f}".format(
+                universe, -rate, size * 10**-3, age, interval) + (h.bcolors.ENDC if color else ''))
+        if len(rows) > self.MAX_ROWS:
+            lines.append("... {} more".format(len(rows) - self.MAX_ROWS))
+
+        # Move up to the first line of the last refresh and overwrite it
+        out = "\033[{}F".format(self.lines) if self.lines else ""
+        out += "".join("\033[K" + line + "\n" for line in lines)
+        if len(lines) < self.lines:
+            out += "\033[J"
+        sys.stdout.write(out)
+        sys.stdout.flush()
+        self.lines = len(lines)
@@ -0,0 +1,309 @@
+#!/usr/bin/env python
+import time
+
+from gzip import GzipFile
+from io import TextIOWrapper
+from pathlib import Path
+
+# local imports
+import helpfunctions as h
+
+
+class RecordingStream:
+    """Iterates the lines of a recording with their offset since the start.
+
+    Only the delay is parsed, the rest of the line is passed on as it is,
+    so edits run at about the speed of reading and writing the text.
+    Duration and universes are known after the iteration reached the end.
+    """
+
+    def __init__(self, path: Path):
+        self.path = path
+        self.duration = None  # ns
+        self.universes = None
+
+    def __iter__(self):
+        offset = 0
+        with h.open_recording(self.path) as textfile:
+            for line in textfile:
+                if line[0] == '!':
+                    # Empty universes when every universe was dropped: "! 1234"
+                    universes, _, length = line[1:].rpartition(' ')
+                    self.universes = h.parse_universes(universes)
+                    self.duration = int(length) * 10**6
+                    return
+
+                split = line.find(' ')
+                if split <= 0 or not line[:split].isdigit():
+                    continue
+
+                offset += int(line[:split])
+                yield offset, line[split:]
+
+        # Footerless recording, ends with its last packet
+        self.duration = offset
+
+
+class RecordingWriter:
+    """Writes the header, lines with their offset and adds the footer on close.
+
+    The footer lists the universes actually written, so it always matches
+    the content, whatever was cut or filtered.
+    """
+
+    BUFFER = 1 << 20  # 1MB
+
+    def __init__(self, path: Path, universes=()):
+        """Opens the file and writes the header
+
+        Args:
+            path (Path): .artrec or .rawrec file
+            universes (iterable): Universes of the header, the ones expected in the recording
+        """
+        self.path = path
+        if path.suffix == '.artrec':
+            self.writer = TextIOWrapper(GzipFile(path, 'wb', compresslevel=6))
+        else:
+            self.writer = open(path, 'w', buffering=self.BUFFER)
+        self.writer.write(h.make_header(universes))
+
+        self.last = 0
+        self.packets = 0
+        self.universes = set()
+        self.duration = None
+
+    def write(self, offset: int, rest: str):
+        """Writes a line
+
+        Args:
+            offset (int): Time since the start in ns, not before the last written line
+            rest (str): Line after the delay, " universe [data]\\n" or " sync\\n"
+        """
+        self.writer.write(str(offset - self.last) + rest)
+        self.last = offset
+
+        if rest[1] != 's':
+            self.universes.add(rest[1:rest.find(' ', 1)])
+            self.packets += 1
+
+    def close(self, duration: int):
+        """Writes the footer and closes the file
+
+        Args:
+            duration (int): Length of the recording in ns
+        """
+        self.duration = max(duration, self.last)
+        self.writer.write('!' + h.format_universes(map(int, self.universes)) + " " +
+                          str(round(self.duration * 10**-6)) + "\n")
+        self.writer.close()
+
+
+def trim(source: Path, out: Path, start: int = 0, end: int = None):
+    """Keeps the time range from start to end
+
+    Args:
+        start (int): Start in ns
+        end (int): End in ns, None for the end of the recording
+
+    Returns:
+        RecordingWriter: Closed writer with the counts
+    """
+    stream = RecordingStream(source)
+    writer = RecordingWriter(out, h.read_header(source))
+
+    for offset, rest in stream:
+        if offset < start:
+            continue
+        if end is not None and offset >= end:
+            # Stops early, no need to read the rest
+            writer.close(end - start)
+            return writer
+        writer.write(offset - start, rest)
+
+    writer.close(min(stream.duration, end if end is not None else stream.duration) - start)
+    return writer
+
+
+def cut(source: Path, out: Path, start: int, end: int):
+    """Removes the time range from start to end, the rest moves up
+
+    Args:
+        start (int): Start in ns
+        end (int): End in ns
+
+    Returns:
+        RecordingWriter: Closed writer with the counts
+    """
+    stream = RecordingStream(source)
+    writer = RecordingWriter(out, h.read_header(source))
+
+    for offset, rest in stream:
+        if offset < start:
+            writer.write(offset, rest)
+        elif offset >= end:
+            writer.write(offset - (end - start), rest)
+
+    writer.close(stream.duration - max(min(end, stream.duration) - start, 0))
+    return writer
+
+
+def concat(sources: list, out: Path, gap: int = 0):
+    """Plays the recordings one after another
+
+    Args:
+        sources (list): Recordings in order
+        gap (int): Pause between the recordings in ns
+
+    Returns:
+        RecordingWriter: Closed writer with the counts
+    """
+    writer = RecordingWriter(out, sorted(set().union(*map(h.read_header, sources))))
+    base = 0
+
+    for source in sources:
+        stream = RecordingStream(source)
+        for offset, rest in stream:
+            writer.write(base + offset, rest)
+        base += stream.duration + gap
+
+    writer.close(base - gap if sources else 0)
+    return writer
+
+
+def filter_universes(source: Path, out: Path, universes: list, drop: bool = False):
+    """Extracts or drops universes, ArtSync is kept
+
+    Args:
+        universes (list): Universes to extract or drop
+        drop (bool): Drop the universes instead of extracting them
+
+    Returns:
+        RecordingWriter: Closed writer with the counts
+    """
+    stream = RecordingStream(source)
+    writer = RecordingWriter(out, [u for u in h.read_header(source) if u not in universes] if drop else universes)
+    selected = {str(u) for u in universes}
+
+    for offset, rest in stream:
+        if rest[1] == 's' or (rest[1:rest.find(' ', 1)] in selected) != drop:
+            writer.write(offset, rest)
+
+    writer.close(stream.duration)
+    return writer
+
+
+def used_channels(data: str):
+    """Returns the highest channel that is not 0
+
+    Args:
+        data (str): Recorded DMX data without brackets, "1, 2, 0, 0"
+    """
+    # Strips the trailing zeros as text, a number like 10 loses its 0 and is completed again
+    pos = len(data.rstrip('0, '))
+    if pos == 0:
+        return 0
+    if pos < len(data) and data[pos] == '0':
+        end = data.find(',', pos)
+        pos = end if end >= 0 else len(data)
+    return data.count(',', 0, pos) + 1
+
+
+def analyze_channels(source: Path):
+    """Finds the highest channel in use of every universe
+
+    Returns:
+        dict: Port-Address -> even channel count, see helpfunctions.parse_channels
+    """
+    highest = dict()
+    for offset, rest in RecordingStream(source):
+        if rest[1] == 's':
+            continue
+        split = rest.find(' ', 1)
+        universe = rest[1:split]
+        used = used_channels(rest[split + 2:rest.rfind(']')])
+        if used > highest.get(universe, -1):
+            highest[universe] = used
+
+    return {int(u): h.even_length(used) for u, used in highest.items()}
+
+
+def compact(source: Path, out: Path, channels: dict = None):
+    """Trims every packet to the channels in use of its universe
+
+    Args:
+        channels (dict): Channel count per universe, analyzed in a first pass if None
+
+    Returns:
+        RecordingWriter: Closed writer with the counts
+    """
+    if channels is None:
+        channels = analyze_channels(source)
+    limits = {str(u): count for u, count in channels.items()}
+
+    stream = RecordingStream(source)
+    writer = RecordingWriter(out, h.read_header(source))
+
+    for offset, rest in stream:
+        if rest[1] != 's':
+            split = rest.find(' ', 1)
+            limit = limits.get(rest[1:split])
+            if limit is not None:
+                data = rest[split + 2:rest.rfind(']')].split(', ', limit)
+                if len(data) > limit:
+                    rest = rest[:split + 2] + ', '.join(data[:limit]) + ']\n'
+        writer.write(offset, rest)
+
+    writer.close(stream.duration)
+    writer.channels = channels
+    return writer
+
+
+def run_edit(mode: str, sources: list, out: Path, start: float = None, end: float = None,
+             universes: list = None, channels: dict = None):
+    """Runs an edit from the command line and prints a summary
+
+    Args:
+        mode (str): trim, cut, concat, extract, drop or compact
+        sources (list): Input recordings
+        out (Path): Output file or directory
+        start (float): Start of the time range in seconds
+        end (float): End of the time range in seconds
+        universes (list): Universes to extract or drop
+        channels (dict): Channel count per universe to compact to, analyzed if None
+    """
+    if not sources:
+        raise ValueError("No input recording given")
+    if out.is_dir() or out.name == '':
+        out = Path(out, sources[0].stem + "_" + mode + sources[0].suffix)
+    if any(out.resolve() == s.resolve() for s in sources):
+        raise ValueError("Output must not overwrite an input")
+
+    start_ns = int(start * 10**9) if start is not None else 0
+    end_ns = int(end * 10**9) if end is not None else None
+    size = sum(s.stat().st_size for s in sources)
+    began = time.perf_counter()
+
+    if mode == 'trim':
+        writer = trim(sources[0], out, start_ns, end_ns)
+    elif mode == 'cut':
+        if start is None or end is None:
+            raise ValueError("Cut needs --start and --end")
+        writer = cut(sources[0], out, start_ns, end_ns)
+    elif mode == 'concat':
+        writer = concat(sources, out)
+    elif mode in ('extract', 'drop'):
+        if not universes:
+            raise ValueError("No universes given")
+        writer = filter_universes(sources[0], out, universes, drop=mode == 'drop')
+    elif mode == 'compact':
+        writer = compact(sources[0], out, channels)
+        print("Channels in use: " + h.format_channels(writer.channels))
+    else:
+        raise ValueError("Invalid edit mode")
+
+    elapsed = time.perf_counter() - began
+    print(h.bcolors.OKGREEN + "Wrote '{}': {} packets, universes {}, {:.1f}s long".format(
+        out, writer.packets, h.format_universes(map(int, writer.universes)),
+        writer.duration * 10**-9) + h.bcolors.ENDC)
+    print("Processed {:.1f} MB in {:.2f}s ({:.1f} MB/s), output {:.1f} MB".format(
+        size * 10**-6, elapsed, size * 10**-6 / max(elapsed, 10**-9), out.stat().st_size * 10**-6))
@@ -0,0 +1,132 @@
+#!/usr/bin/env python
+import socket
+
+from array import array
+from time import monotonic_ns
+
+# local imports
+import helpfunctions as h
+from smartnet import Smartnet
+
+
+def source_address(target_ip: str):
+    """Returns the local IP the packets to target_ip are sent from, as chosen by the routing"""
+    probe = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    probe.setsockopt(socket.SOL_SOCKET, socket.SO_BROADCAST, 1)
+    try:
+        # Connecting a UDP socket sends nothing, it only picks the route
+        probe.connect((target_ip, Smartnet.UDP_PORT))
+        return probe.getsockname()[0]
+    except OSError:
+        return None
+    finally:
+        probe.close()
+
+
+class ArtNetForwarder:
+    """Forwards received ArtDmx packets to other nodes, straight from the receive path.
+
+    Packets of unmapped universes are sent on as they are. Remapped
+    universes are copied into a preassembled packet of the new universe,
+    so forwarding allocates nothing per packet. Our own packets coming
+    back, e.g. to a broadcast address, are neither forwarded nor recorded.
+
+    Known limitation: the latency includes the time a packet waits in the
+    socket until the receive thread runs. With many universes on a busy
+    single core host (64 universes at 44Hz on one CPU shared with the
+    sender) the median stays below 1ms, the p99 does not.
+    """
+
+    SAMPLES = 1 << 16  # Latencies kept for the report
+
+    def __init__(self, routes: list, universes: list):
+        """Prepares the routes.
+
+        Args:
+            routes (list): "ip" or "ip/remap" per destination, remap like "0-3>10,7>20", see parse_remap
+            universes (list): Universes to forward
+        """
+        self.universes = set(universes)
+        self.socket_client = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.socket_client.setsockopt(socket.SOL_SOCKET, socket.SO_BROADCAST, 1)
+        self.socket_client.bind(('', 0))
+
+        # (address, universe -> preassembled packet of the new universe)
+        self.routes = []
+        a = Smartnet('127.0.0.1', [])  # Only assembles packets
+        for route in routes:
+            target_ip, _, remap = route.strip('" ').partition('/')
+            remap = h.parse_remap(remap) if remap else dict()
+            buffers = {u: a.make_packet(bytearray(512), target) for u, target in remap.items() if u in self.universes}
+            self.routes.append(((target_ip, Smartnet.UDP_PORT), buffers))
+        a.close()
+
+        # Sender addresses of our own packets, a node elsewhere may use the same port
+        port = self.socket_client.getsockname()[1]
+        self.own = {(source_address(address[0]), port) for address, buffers in self.routes}
+
+        self.forwarded = 0
+        self.latencies = array('q', bytes(8 * self.SAMPLES))
+        self.max_latency = 0
+
+        print(h.bcolors.OKBLUE + "Forward: {}".format(", ".join(route.strip('" ') for route in routes)) + h.bcolors.ENDC)
+
+    def forward(self, data, source: tuple, received: int):
+        """Sends one received ArtDmx packet to every destination
+
+        Args:
+            data (bytes): Complete ArtDmx packet
+            source (tuple): Address of the sender
+            received (int): Monotonic receive time in ns
+
+        Returns:
+            bool: True for our own packet, it has to be dropped
+        """
+        if source in self.own:
+            return True
+        universe = data[14] | data[15] << 8
+        if universe not in self.universes:
+            return False
+
+        size = len(data)
+        for address, buffers in self.routes:
+            packet = buffers.get(universe)
+            try:
+                if packet is None:
+                    self.socket_client.sendto(data, address)
+                else:
+                    # Sequence and physical port, then length and data behind the new universe
+                    packet[12:14] = data[12:14]
+                    packet[16:size] = data[16:size]
+                    self.socket_client.sendto(memoryview(packet)[:size], address)
+            except socket.error as error:
+                print(f"ERROR: Socket error with exception: {error}")
+
+        latency = monotonic_ns() - received
+        self.latencies[self.forwarded % self.SAMPLES] = latency
+        self.max_latency = max(latency, self.max_latency)
+        self.forwarded += 1
+        return False
+
+    def status(self):
+        """Returns the latency of the latest packets for the dashboard"""
+        count = min(self.forwarded, 256)
+        if not count:
+            return "forward -"
+        latest = [self.latencies[(self.forwarded - i) % self.SAMPLES] for i in range(1, count + 1)]
+        return "forward {:.3f}ms avg, {:.3f}ms max".format(sum(latest) / count * 10**-6, max(latest) * 10**-6)
+
+    def report(self):
+        """Prints the added latency from receiving to sending"""
+        if not self.forwarded:
+            print(h.bcolors.WARNING + "Nothing forwarded." + h.bcolors.ENDC)
+            return
+
+        samples = sorted(self.latencies[:min(self.forwarded, self.SAMPLES)])
+        p50, p99 = samples[len(samples) // 2], samples[min(int(len(samples) * 0.99), len(samples) - 1)]
+        color = h.bcolors.OKGREEN if p99 < 10**6 else h.bcolors.FAIL
+        print(color + "Forwarded {} packets, latency median {:.3f}ms, p99 {:.3f}ms, max {:.3f}ms".format(
+            self.forwarded, p50 * 10**-6, p99 * 10**-6, self.max_latency * 10**-6) + h.bcolors.ENDC)
+
+    def close(self):
+        self.socket_client.close()
@@ -1,8 +1,24 @@
+import re
+
+from datetime import datetime
+from io import TextIOWrapper
 from gzip import GzipFile
 from pathlib import Path
 from tempfile import gettempdir
 
 
+# Regex pattern for parsing a recorded line: "delay universe [data]" or "delay sync" (ArtSync)
+LINE_PATTERN = re.compile(
+    r"(?P<delay>[0-9]+)\s(?:(?P<universe>[0-9]+)\s\[(?P<data>[0-9, ]*)\]|(?P<sync>sync))")
+
+# Recordings describe themselves from the first line on:
+# "#ARPS version universes start", then "#checkpoint offset packets bytes crc32" while recording,
+# the "!universes length" footer is only written on a clean stop
+HEADER_PREFIX = '#ARPS'
+FORMAT_VERSION = 1
+CHECKPOINT_PREFIX = '#checkpoint'
+
+
 def write_file(data, fname, compress=True):
     if compress:
         f = GzipFile(fname, 'wb')
@@ -30,6 +46,214 @@ def unzip_file(source: Path):
     return tmp_file
 
 
+def open_recording(source: Path):
+    """Opens a recording as textfile, .artrec files are unzipped on the fly
+
+    Args:
+        source (Path): Location of .artrec or .rawrec file
+
+    Returns:
+        TextIO: Opened textfile
+    """
+    if source.suffix == '.artrec':
+        return TextIOWrapper(GzipFile(source, 'rb'))
+    return open(source, 'r')
+
+
+def format_line(delay: int, universe: int, data):
+    """Returns the recorded line of a packet: "delay universe [data]"
+
+    Args:
+        delay (int): Time since the last line in ns
+        universe (int): Port-Address
+        data (list): DMX data
+    """
+    return str(delay) + " " + str(universe) + " " + str(data) + "\n"
+
+
+def read_packets(textfile, sync=False):
+    """Generator over all packets of a recording, stops at the footer.
+
+    Args:
+        textfile (TextIO): Opened recording
+        sync (bool): Yield ArtSync packets as (offset, None, None)
+
+    Yields:
+        tuple(int[offset since start in ns], int[universe], bytearray[data])
+    """
+    offset = 0
+    for line in textfile:
+        if line[0] == '!':
+            break
+
+        match = LINE_PATTERN.match(line)
+        if match is None:
+            continue
+
+        offset += int(match.group('delay'))
+        if match.group('sync'):
+            if sync:
+                yield offset, None, None
+            continue
+
+        data = match.group('data')
+        yield offset, int(match.group('universe')), bytearray(map(int, data.split(','))) if data else bytearray()
+
+
+def make_header(universes):
+    """Returns the header line of a new recording
+
+    Args:
+        universes (iterable): Recorded Port-Addresses
+    """
+    return "{} {} {} {}\n".format(HEADER_PREFIX, FORMAT_VERSION, format_universes(universes) or '-',
+                                  datetime.now().isoformat(timespec='seconds'))
+
+
+def read_header(source: Path):
+    """Returns the universes of the header of a recording, empty if it has no header
+
+    Args:
+        source (Path): Location of .artrec or .rawrec file
+    """
+    with open_recording(source) as textfile:
+        fields = textfile.readline().split()
+    if len(fields) < 3 or fields[0] != HEADER_PREFIX or fields[2] == '-':
+        return []
+    return parse_universes(fields[2])
+
+
+def make_checkpoint(offset: int, packets: int, size: int, crc: int):
+    """Returns a checkpoint line
+
+    Args:
+        offset (int): Offset of the last line since the start in ns
+        packets (int): ArtDmx packets written so far
+        size (int): Bytes written since the previous checkpoint or the header
+        crc (int): CRC32 of these bytes
+    """
+    return "{} {} {} {} {:08x}\n".format(CHECKPOINT_PREFIX, offset, packets, size, crc)
+
+
+def parse_universes(text: str):
+    """Parses universes like "0,1,5-8,1.2.3,1.3.0-1.3.15"
+
+    Dotted universes are Net.Sub-Net.Universe, plain numbers the full
+    15 bit Port-Address (0-32767).
+
+    Args:
+        text (str): Comma separated universes and ranges
+
+    Returns:
+        list[int]: Sorted Port-Addresses
+    """
+
+    def address(item):
+        if '.' in item:
+            net, sub, universe = map(int, item.split('.'))
+            if not (0 <= net <= 127 and 0 <= sub <= 15 and 0 <= universe <= 15):
+                raise ValueError("Invalid Net.Sub-Net.Universe: " + item)
+            return net << 8 | sub << 4 | universe
+        return int(item)
+
+    universes = set()
+    for item in text.strip('" ').split(','):
+        item = item.strip()
+        if not item:
+            continue
+
+        first, _, last = item.partition('-')
+        first = address(first)
+        last = address(last) if last else first
+        if not 0 <= first <= last <= 0x7FFF:
+            raise ValueError("Invalid universe range: " + item)
+
+        universes.update(range(first, last + 1))
+
+    return sorted(universes)
+
+
+def format_universes(universes):
+    """Formats universes compact with ranges, "0-3,7", see parse_universes
+
+    Args:
+        universes (iterable): Port-Addresses
+
+    Returns:
+        str: Comma separated universes and ranges
+    """
+    ranges = []
+    for u in sorted(set(universes)):
+        if ranges and ranges[-1][1] == u - 1:
+            ranges[-1][1] = u
+        else:
+            ranges.append([u, u])
+
+    return ','.join(str(a) if a == b else "{}-{}".format(a, b) for a, b in ranges)
+
+
+def even_length(channels: int):
+    """Rounds a channel count up to a valid ArtDmx length, even and 2-512"""
+    return min(max(channels + (channels & 1), 2), 512)
+
+
+def parse_channels(text: str):
+    """Parses channel counts per universe like "0-3:48,7:96", see parse_universes
+
+    Args:
+        text (str): Comma separated universes or ranges with their channel count
+
+    Returns:
+        dict: Port-Address -> even channel count
+    """
+    channels = dict()
+    for item in text.strip('" ').split(','):
+        if not item.strip():
+            continue
+        universes, _, count = item.partition(':')
+        if not count:
+            raise ValueError("Missing channel count: " + item)
+        for u in parse_universes(universes):
+            channels[u] = even_length(int(count))
+    return channels
+
+
+def format_channels(channels: dict):
+    """Formats channel counts per universe compact, "0-3:48,7:96", see parse_channels"""
+    groups = dict()
+    for u, count in channels.items():
+        groups.setdefault(count, []).append(u)
+
+    items = []
+    for count, universes in groups.items():
+        items.extend((universe, count) for universe in format_universes(universes).split(','))
+    return ','.join("{}:{}".format(u, count) for u, count in sorted(items, key=lambda i: int(i[0].split('-')[0])))
+
+
+def parse_remap(text: str):
+    """Parses a universe remap like "0-3>10,7>1.2.3", a range is moved as a block, see parse_universes
+
+    Args:
+        text (str): Comma separated universes or ranges with their new (first) universe
+
+    Returns:
+        dict: Port-Address -> new Port-Address
+    """
+    remap = dict()
+    for item in text.strip('" ').split(','):
+        if not item.strip():
+            continue
+        universes, _, target = item.partition('>')
+        if not target:
+            raise ValueError("Missing target universe: " + item)
+        universes, target = parse_universes(universes), parse_universes(target)[0]
+        for u in universes:
+            remap[u] = target + u - universes[0]
+            if remap[u] > 0x7FFF:
+                raise ValueError("Target universe out of range: " + item)
+    return remap
+
+
 class bcolors:
     PINK = '\033[95m'
     OKBLUE = '\033[94m'
@@ -0,0 +1,152 @@
+#!/usr/bin/env python
+from collections import deque
+
+# local imports
+import helpfunctions as h
+
+LANES = 512  # Channels per universe, one 16 bit lane each
+WIDE = 2 * LANES  # Bytes of a frame in lanes
+ALL_LANES = (1 << 8 * WIDE) - 1
+LOW_BYTES = ALL_LANES // 0xFFFF * 0xFF  # 0x00FF in every lane, the values
+CARRIES = LOW_BYTES + ALL_LANES // 0xFFFF  # 0x0100 in every lane, above the values
+
+
+def parse_hold(text: str):
+    """Parses the channels that are not faded like "0-3:1-4+9,7:12", channels count from 1
+
+    Args:
+        text (str): Comma separated universes or ranges with their channels joined by '+'
+
+    Returns:
+        dict: Port-Address -> set of channels (0 based)
+    """
+    hold = dict()
+    for item in text.strip('" ').split(','):
+        if not item.strip():
+            continue
+        universes, _, channels = item.partition(':')
+        if not channels:
+            raise ValueError("Missing channels: " + item)
+
+        indexes = set()
+        for part in channels.split('+'):
+            first, _, last = part.partition('-')
+            first, last = int(first), int(last or first)
+            if not 1 <= first <= last <= LANES:
+                raise ValueError("Invalid channels: " + part)
+            indexes.update(range(first - 1, last))
+
+        for u in h.parse_universes(universes):
+            hold.setdefault(u, set()).update(indexes)
+    return hold
+
+
+def to_lanes(data):
+    """Returns the DMX data as one int with a 16 bit lane per channel, the value in the low byte"""
+    wide = bytearray(WIDE)
+    wide[0:2 * len(data):2] = data
+    return int.from_bytes(wide, 'little')
+
+
+def from_lanes(lanes: int, size: int):
+    """Returns the first size channels of lanes as DMX data"""
+    return bytearray(lanes.to_bytes(WIDE, 'little')[0:2 * size:2])
+
+
+def lane_mask(channels):
+    """Returns an int with all bits of the lanes of channels set"""
+    mask = bytearray(WIDE)
+    for channel in channels:
+        mask[2 * channel:2 * channel + 2] = b'\xff\xff'
+    return int.from_bytes(mask, 'little')
+
+
+class Frame:
+    """A recorded frame of one universe, kept in lanes to be blended."""
+
+    __slots__ = ('offset', 'data', 'lanes', 'held')
+
+    def __init__(self, offset: int, data):
+        self.offset = offset
+        self.data = bytes(data)
+        self.lanes = to_lanes(data)
+        self.held = self.lanes << 8  # The frame as a blend with weight 0
+
+
+class FrameInterpolator:
+    """Upsamples a recording to a fixed rate with linearly faded frames.
+
+    All 512 channels of a universe are blended at once: a frame is one
+    Python int with a 16 bit lane per channel, so A*(256-w) + B*w blends
+    every channel with two multiplications without carries between the
+    lanes, the high byte of each lane is the result. Held channels take
+    the earlier frame through a lane mask.
+    """
+
+    FADE_GAP = 2 * 10**8  # Frames further apart are not faded, e.g. a pause or a jump
+
+    def __init__(self, rate: float, hold: dict = None):
+        """Initializes the interpolator.
+
+        Args:
+            rate (float): Output frames per second
+            hold (dict): Channels per universe that step instead of fading, see parse_hold
+        """
+        self.period = int(10**9 / rate)
+        self.masks = {u: lane_mask(channels) for u, channels in (hold or dict()).items()}
+
+    def blend(self, universe: int, a: Frame, b: Frame, offset: int):
+        """Returns the data of universe at offset between the frames a and b"""
+        weight = ((offset - a.offset) << 8) // (b.offset - a.offset)
+        if weight == 0:
+            return a.data
+
+        blended = a.lanes * (256 - weight) + b.lanes * weight
+        mask = self.masks.get(universe)
+        if mask is not None:
+            blended = (blended & (ALL_LANES ^ mask)) | (a.held & mask)
+
+        size = max(len(a.data), len(b.data))
+        return blended.to_bytes(WIDE, 'little')[1:2 * size:2]
+
+    def frames(self, packets):
+        """Generator over the output frames of a recording
+
+        Args:
+            packets (iterator): (offset, universe, data) like helpfunctions.read_packets
+
+        Yields:
+            tuple(int[offset in ns], int[universe], bytes[data])
+        """
+        universes = dict()  # universe -> deque of the frames from the last one before the tick
+        tick = None
+
+        def output(until):
+            """Yields the ticks before until, every universe needs its next frame within FADE_GAP"""
+            nonlocal tick
+            while tick < until:
+                for universe, queue in universes.items():
+                    # The frame before the tick first
+                    while len(queue) > 1 and queue[1].offset <= tick:
+                        queue.popleft()
+
+                    a = queue[0]
+                    if a.offset > tick:
+                        continue
+                    if len(queue) > 1 and queue[1].offset - a.offset <= self.FADE_GAP:
+                        yield tick, universe, self.blend(universe, a, queue[1], tick)
+                    else:
+                        yield tick, universe, a.data
+                tick += self.period
+
+        for offset, universe, data in packets:
+            if tick is None:
+                tick = offset
+
+            # A later frame of any universe may still fade into these ticks
+            yield from output(offset - self.FADE_GAP)
+            universes.setdefault(universe, deque()).append(Frame(offset, data))
+
+        if tick is not None:
+            last = max(queue[-1].offset for queue in universes.values())
+            yield from output(last + 1)
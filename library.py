@@ -0,0 +1,147 @@
+#!/usr/bin/env python
+import hashlib
+import sqlite3
+import zlib
+
+from os import scandir
+from pathlib import Path
+
+# local imports
+import helpfunctions as h
+from recovery import RecoveryInfo
+
+
+class RecordingLibrary:
+    """On-disk metadata index of all recordings in a directory.
+
+    The index is a SQLite file inside the directory. A recording is only
+    scanned again, when its mtime or size changed, so listing a big library
+    needs one stat per file instead of reading every file.
+    """
+
+    INDEX_NAME = '.arps_index.sqlite'
+    CHUNK = 1 << 20  # 1MB
+
+    def __init__(self, path: Path):
+        """Opens (or creates) the index of a directory.
+
+        Args:
+            path (Path): Directory of recordings
+        """
+        self.dir = path
+        self.db = sqlite3.connect(Path(path, self.INDEX_NAME))
+        self.db.execute("""CREATE TABLE IF NOT EXISTS recordings (
+            name TEXT PRIMARY KEY,
+            mtime_ns INTEGER,
+            size INTEGER,
+            duration INTEGER,
+            universes TEXT,
+            packets INTEGER,
+            fps REAL,
+            hash TEXT)""")
+        self.rows = dict()
+
+    def update(self):
+        """Scans new or changed recordings and drops deleted ones
+
+        Returns:
+            int: Number of (re)scanned recordings
+        """
+        known = {row[0]: row for row in self.db.execute("SELECT * FROM recordings")}
+        self.rows = dict()
+        scanned = 0
+
+        for entry in scandir(self.dir):
+            if not entry.name.endswith(('.artrec', '.rawrec')) or not entry.is_file():
+                continue
+
+            stat = entry.stat()
+            row = known.pop(entry.name, None)
+
+            # Invalidate by mtime and size
+            if row is None or row[1] != stat.st_mtime_ns or row[2] != stat.st_size:
+                row = (entry.name, stat.st_mtime_ns, stat.st_size) + self.scan(Path(entry.path))
+                self.db.execute("INSERT OR REPLACE INTO recordings VALUES (?, ?, ?, ?, ?, ?, ?, ?)", row)
+                scanned += 1
+
+            self.rows[entry.name] = row
+
+        self.db.executemany("DELETE FROM recordings WHERE name = ?", ((name,) for name in known))
+        self.db.commit()
+
+        return scanned
+
+    def scan(self, path: Path):
+        """Reads a recording once for its metadata, .artrec files are decompressed on the fly
+
+        Returns:
+            tuple(int[duration in ms], str[universes], int[packets], float[fps], str[sha1 of the file])
+        """
+        sha1 = hashlib.sha1()
+        unzip = zlib.decompressobj(zlib.MAX_WBITS | 16) if path.suffix == '.artrec' else None
+
+        packets = 0
+        tail = b''  # Last line, the footer
+        last = b''  # Last byte of the previous chunk
+
+        with open(path, 'rb') as f:
+            for chunk in iter(lambda: f.read(self.CHUNK), b''):
+                sha1.update(chunk)
+                if unzip is not None:
+                    chunk = unzip.decompress(chunk)
+
+                # Every ArtDmx line ends with "]\n", syncs and the footer don't
+                packets += chunk.count(b']\n') + (last == b']' and chunk[:1] == b'\n')
+                last = chunk[-1:] or last
+
+                tail += chunk
+                cut = tail.rfind(b'\n', 0, len(tail) - 1)
+                if cut >= 0:
+                    tail = tail[cut + 1:]
+
+        duration, universes, fps = None, '', None
+        if tail[:1] == b'!':
+            info = tail.decode().strip('!\n').split(' ')
+            duration = int(info[1])
+            count = len(h.parse_universes(info[0]))
+            universes = h.format_universes(h.parse_universes(info[0]))
+
+        # Footerless, rebuilt from the header and the last checkpoint
+        elif unzip is None:
+            duration, universes = RecoveryInfo(path).footer_info()
+            count = len(universes)
+            universes = h.format_universes(universes)
+
+        # Average refresh rate per universe
+        if duration and count:
+            fps = round(packets / count / (duration * 10**-3), 2)
+
+        return duration, universes, packets, fps, sha1.hexdigest()
+
+    def files(self):
+        """Returns the names of all indexed recordings"""
+        return sorted(self.rows)
+
+    def info(self, name: str):
+        """Returns the footer info of a recording like ArtNetPlayback.get_footer_info
+
+        Returns:
+            tuple(int[duration in ms], list[int(universes)]) or None if not indexed or footerless
+        """
+        row = self.rows.get(name)
+        if row is None or row[3] is None:
+            return None
+        return row[3], h.parse_universes(row[4])
+
+    def print_table(self):
+        print(h.bcolors.OKBLUE + "{:<40} {:>10} {:>8} {:>7}  {:<24} {}".format(
+            "Name", "Duration", "Packets", "FPS", "Universes", "Hash") + h.bcolors.ENDC)
+
+        for name in self.files():
+            row = self.rows[name]
+            print("{:<40} {:>10} {:>8} {:>7}  {:<24} {}".format(
+                name, "{:.1f}s".format(row[3] * 10**-3) if row[3] is not None else "broken",
+                row[5], row[6] or '-', row[4], row[7][:12]))
+
+    def close(self):
+        self.db.close()
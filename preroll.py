@@ -0,0 +1,262 @@
+#!/usr/bin/env python
+import heapq
+import socket
+import threading
+import time
+
+from datetime import datetime
+from ipaddress import IPv4Address
+from operator import itemgetter
+from pathlib import Path
+from struct import Struct
+
+# local imports
+import helpfunctions as h
+from edit import RecordingWriter
+from smartnet import SmartNetServer
+
+SLOT_HEADER = Struct('<qH')  # Receive time in ns, length of the data
+
+
+class PacketRing:
+    """The last packets of one universe in a preallocated buffer.
+
+    Every slot is [receive time][length][data], the oldest slot is
+    overwritten, so the memory never grows after the start.
+    """
+
+    def __init__(self, slots: int, size: int):
+        """Allocates the ring.
+
+        Args:
+            slots (int): Packets held
+            size (int): Bytes of data per packet, longer data is cut
+        """
+        self.slots = slots
+        self.size = size
+        self.slot = SLOT_HEADER.size + size
+        self.buffer = bytearray(slots * self.slot)
+        self.count = 0  # Packets written since the start
+
+    def put(self, timestamp: int, data):
+        offset = (self.count % self.slots) * self.slot
+        data = data[:self.size]
+        SLOT_HEADER.pack_into(self.buffer, offset, timestamp, len(data))
+        self.buffer[offset + SLOT_HEADER.size:offset + SLOT_HEADER.size + len(data)] = bytes(data)
+        self.count += 1
+
+    def snapshot(self, since: int = 0):
+        """Copies the slots written after packet number since, oldest first
+
+        Returns:
+            tuple(int[count], int[packets already overwritten], bytes[slots])
+        """
+        first = max(since, self.count - self.slots)
+        if first == self.count:
+            return self.count, first - since, b''
+
+        start, end = (first % self.slots) * self.slot, (self.count % self.slots) * self.slot
+        if start < end:
+            return self.count, first - since, bytes(self.buffer[start:end])
+        return self.count, first - since, bytes(self.buffer[start:]) + bytes(self.buffer[:end])
+
+    def packets(self, raw: bytes, universe: int):
+        """Generator over a snapshot
+
+        Yields:
+            tuple(int[receive time], int[universe], memoryview[data])
+        """
+        view = memoryview(raw)
+        for offset in range(0, len(raw), self.slot):
+            timestamp, size = SLOT_HEADER.unpack_from(raw, offset)
+            yield timestamp, universe, view[offset + SLOT_HEADER.size:offset + SLOT_HEADER.size + size]
+
+    @property
+    def nbytes(self):
+        return len(self.buffer)
+
+
+class PrerollCapture:
+    """Keeps the last minutes of every universe in memory, saves them on command.
+
+    Commands (one per datagram, the reply goes back to the sender):
+        save [file]     write the buffer to a recording
+        record [file]   write the buffer and keep recording until stop
+        stop            finish the running recording
+        status          buffered time, memory and recording state
+    """
+
+    CONTROL_PORT = 7777
+    RATE = 44  # Highest Art-Net refresh rate, sizes the rings
+    FILENAME = "Pre-Roll_{:%Y-%m-%d_%H%M%S}.rawrec"
+
+    def __init__(self, universes: list, window: float = 5, path: Path = Path(), port: int = CONTROL_PORT,
+                 channels: dict = None, interfaces: list = None, sources: list = None):
+        """Allocates the rings, the memory stays the same while capturing.
+
+        Args:
+            universes (list): Universes to capture
+            window (float): Minutes kept per universe at RATE
+            path (Path): Directory of the saved recordings
+            port (int): Local UDP port for commands
+            channels (dict): Channel count per universe, only these channels are kept
+            interfaces (list): IPs or interface names to listen on, all if None
+            sources (list): IPs of the senders to capture, all if None
+        """
+        self.universes = universes
+        self.window = int(window * 60 * 10**9)
+        self.path = path
+        self.port = port
+        self.interfaces = interfaces
+        self.allowed = [str(IPv4Address(source)) for source in sources] if sources else None
+
+        slots = max(int(window * 60 * self.RATE), 1)
+        channels = channels or dict()
+        self.rings = {u: PacketRing(slots, channels.get(u, 512)) for u in universes}
+        self.sync_ring = PacketRing(slots, 0)
+        self.lock = threading.Lock()  # Between the server thread and the snapshots
+
+        self.start = time.monotonic_ns()
+        self.recording = None  # (path, thread) of the running save or recording
+        self.stop_recording = threading.Event()
+
+        memory = sum(ring.nbytes for ring in self.rings.values()) + self.sync_ring.nbytes
+        print(h.bcolors.OKBLUE + "----------pre-roll----------\nUniverses: {}\nWindow: {:.1f} min, {} packets per universe\n"
+              "Memory: {:.1f} MB\nControl: udp://127.0.0.1:{}".format(
+                  h.format_universes(universes), window, slots, memory * 10**-6, port) + h.bcolors.ENDC)
+
+    def __callback(self, data, universe: int):
+        """Callback for every packet, copies it into the ring of its universe"""
+        with self.lock:
+            self.rings[universe].put(self.a.packet_time, data)
+
+    def __sync_callback(self):
+        with self.lock:
+            self.sync_ring.put(self.a.packet_time, b'')
+
+    def writer_thread(self, path: Path, follow: bool):
+        """Writes the buffer, then the new packets until stop if following
+
+        Args:
+            path (Path): .rawrec or .artrec file
+            follow (bool): Keep recording after the buffer
+        """
+        writer = RecordingWriter(path, self.universes)
+        rings = [(None, self.sync_ring)] + list(self.rings.items())
+        since = [0] * len(rings)
+        start = last = None
+        lost = -1  # The first copy starts at the oldest slot on purpose
+
+        while True:
+            stopping = self.stop_recording.is_set()
+
+            # Only the copies are locked, formatting runs beside the capture
+            with self.lock:
+                snapshots = [ring.snapshot(since[i]) for i, (universe, ring) in enumerate(rings)]
+
+            streams = []
+            for i, ((universe, ring), (count, overwritten, raw)) in enumerate(zip(rings, snapshots)):
+                since[i] = count
+                if lost >= 0:
+                    lost += overwritten
+                streams.append(ring.packets(raw, universe))
+            lost = max(lost, 0)
+
+            for timestamp, universe, data in heapq.merge(*streams, key=itemgetter(0)):
+                if start is None:
+                    start = last = timestamp
+                # Packets of the next copy may have been received a little earlier
+                last = max(timestamp, last)
+
+                if universe is None:
+                    writer.write(last - start, " sync\n")
+                else:
+                    writer.write(last - start, " {} {}\n".format(universe, list(data)))
+
+            if not follow or stopping:
+                break
+            time.sleep(0.1)
+
+        duration = time.monotonic_ns() - start if follow and start is not None else 0
+        writer.close(duration)
+
+        print(h.bcolors.OKGREEN + "Saved '{}': {:.1f}s, {} packets".format(
+            path, writer.duration * 10**-9, writer.packets) + h.bcolors.ENDC)
+        if lost:
+            print(h.bcolors.FAIL + "Lost {} packets, the recording fell behind the buffer.".format(lost) + h.bcolors.ENDC)
+
+    def command(self, line: str):
+        """Executes a command, returns the reply
+
+        Args:
+            line (str): Command line
+        """
+        args = line.split()
+        if not args:
+            return "ERROR empty command"
+        cmd = args[0].lower()
+
+        if cmd in ('save', 'record'):
+            if self.recording is not None and self.recording[1].is_alive():
+                return "ERROR still writing '{}'".format(self.recording[0])
+
+            path = Path(args[1]) if len(args) > 1 else Path(self.path, self.FILENAME.format(datetime.now()))
+            self.stop_recording.clear()
+            thread = threading.Thread(target=self.writer_thread, args=(path, cmd == 'record'))
+            self.recording = path, thread
+            thread.start()
+            return "OK {} '{}'".format('recording' if cmd == 'record' else 'saving', path)
+
+        elif cmd == 'stop':
+            if self.recording is None or not self.recording[1].is_alive():
+                return "ERROR not recording"
+            self.stop_recording.set()
+            self.recording[1].join()
+            return "OK saved '{}'".format(self.recording[0])
+
+        elif cmd == 'status':
+            return "OK " + self.status()
+
+        return "ERROR unknown command"
+
+    def status(self):
+        """Returns a one line status string"""
+        buffered = min(time.monotonic_ns() - self.start, self.window)
+        state = "buffered {:.1f}/{:.1f} min, {} packets".format(
+            buffered * 10**-9 / 60, self.window * 10**-9 / 60,
+            sum(min(ring.count, ring.slots) for ring in self.rings.values()))
+
+        if self.recording is not None and self.recording[1].is_alive():
+            state += " | writing '{}'".format(self.recording[0])
+        return state
+
+    def run(self):
+        """Captures and serves commands until Ctrl+C"""
+        self.a = SmartNetServer(None, self.interfaces, self.allowed)
+        self.a.register_multiple_listeners(self.universes, callback_function=self.__callback)
+        self.a.register_sync_listener(self.__sync_callback)
+
+        control = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        control.bind(('127.0.0.1', self.port))
+        control.settimeout(0.5)
+        print(h.bcolors.OKGREEN + "Capturing, ready for commands." + h.bcolors.ENDC)
+
+        try:
+            while True:
+                try:
+                    data, address = control.recvfrom(1024)
+                except socket.timeout:
+                    continue
+
+                reply = self.command(data.decode(errors='replace').strip())
+                control.sendto(reply.encode(), address)
+
+        except KeyboardInterrupt:
+            print("\n\nTERMINATED BY USER, Stopping capture.\n")
+
+        # A running recording is finished with what was received until now
+        if self.recording is not None and self.recording[1].is_alive():
+            self.stop_recording.set()
+            self.recording[1].join()
+
+        control.close()
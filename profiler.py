@@ -0,0 +1,86 @@
+#!/usr/bin/env python
+import cProfile
+
+from pathlib import Path
+from time import perf_counter_ns
+
+
+class StageProfiler:
+    """Low overhead stage timer for the record and playback hot paths.
+
+    A profiler belongs to one thread. Every lap(stage) books the time since
+    the previous lap to that stage, so one clock read per stage is enough.
+    """
+
+    IDLE_STAGES = ('recv', 'sleep')  # Waiting, not work
+
+    def __init__(self, name: str, dump: Path = None):
+        """Initializes the profiler.
+
+        Args:
+            name (str): Name of the profiled path, root of the folded stacks
+            dump (Path): .prof for cProfile stats, any other file for folded stacks (flamegraph.pl, speedscope)
+        """
+        self.name = name
+        self.dump = dump
+        self.stages = dict()  # stage -> [calls, total ns]
+        self.packets = 0
+        self.last = perf_counter_ns()
+        self.cprofile = None
+
+    def lap(self, stage: str):
+        """Books the time since the last lap to stage"""
+        now = perf_counter_ns()
+        counter = self.stages.get(stage)
+        if counter is None:
+            counter = self.stages[stage] = [0, 0]
+        counter[0] += 1
+        counter[1] += now - self.last
+        self.last = now
+
+    def mark(self):
+        """Starts timing without booking, e.g. at the start of a loop"""
+        self.last = perf_counter_ns()
+
+    def packet(self):
+        self.packets += 1
+
+    def wrap(self, target):
+        """Wraps a thread target, runs it under cProfile if a .prof dump is requested"""
+        if self.dump is None or self.dump.suffix != '.prof':
+            return target
+
+        def run(*args, **kwargs):
+            self.cprofile = cProfile.Profile()
+            self.cprofile.enable()
+            self.mark()
+            return target(*args, **kwargs)
+
+        return run
+
+    def report(self):
+        """Prints time per packet of every stage and writes the dump"""
+        busy = sum(total for stage, (calls, total) in self.stages.items() if stage not in self.IDLE_STAGES)
+        packets = self.packets or 1
+
+        print("\n----------profile: {}----------".format(self.name))
+        print("{:<12} {:>10} {:>12} {:>12} {:>7}".format("Stage", "Calls", "Total ms", "us/packet", "Busy %"))
+        for stage, (calls, total) in sorted(self.stages.items(), key=lambda s: -s[1][1]):
+            print("{:<12} {:>10} {:>12.1f} {:>12.2f} {:>7}".format(
+                stage, calls, total * 10**-6, total / packets * 10**-3,
+                "idle" if stage in self.IDLE_STAGES else "{:.1f}".format(total / (busy or 1) * 100)))
+        print("{} packets, {:.2f}us busy per packet".format(self.packets, busy / packets * 10**-3))
+
+        if self.dump is None:
+            return
+
+        if self.dump.suffix == '.prof':
+            if self.cprofile is not None:
+                self.cprofile.dump_stats(self.dump)
+        else:
+            # Folded stacks, one "root;stage microseconds" line per stage
+            with open(self.dump, 'w') as f:
+                for stage, (calls, total) in self.stages.items():
+                    f.write("{};{} {}\n".format(self.name, stage, total // 1000))
+
+        print("Profile written to '{}'".format(self.dump))
@@ -0,0 +1,211 @@
+#!/usr/bin/env python
+import heapq
+import zlib
+
+from glob import escape
+from os import SEEK_END, fsync, remove, rename
+from pathlib import Path
+
+# local imports
+import helpfunctions as h
+
+
+class RecoveryInfo:
+    """Metadata of a recording that was not stopped cleanly.
+
+    Rebuilt from the header, the last checkpoint whose CRC matches and the
+    complete lines after it, so only the tail of the file has to be read.
+    """
+
+    CHUNK = 1 << 16  # Backwards search step
+
+    def __init__(self, path: Path):
+        """Reads the metadata of a footerless recording.
+
+        Args:
+            path (Path): Plain text recording, e.g. a .rawrec.part left by a crash
+        """
+        self.path = path
+        self.universes = []
+        self.offset = 0  # ns, offset of the last valid line
+        self.packets = 0
+        self.end = 0  # Byte position after the last valid line
+        self.checkpoint = None  # Offset of the used checkpoint in ns
+        self.size = path.stat().st_size
+
+        with open(path, 'rb') as f:
+            header = f.readline()
+            if header.startswith(h.HEADER_PREFIX.encode()):
+                universes = header.split()[2].decode()
+                self.universes = h.parse_universes(universes) if universes != '-' else []
+            else:
+                f.seek(0)
+            self.end = f.tell()
+
+            self.find_checkpoint(f)
+            self.read_tail(f)
+
+    def find_checkpoint(self, f):
+        """Searches the last checkpoint with a valid CRC from the end of the file"""
+        marker = b'\n' + h.CHECKPOINT_PREFIX.encode()
+        lower = max(self.end - 1, 0)  # The newline of the marker may end the header
+        search_end = self.size
+
+        while search_end > lower:
+            start = max(search_end - self.CHUNK, lower)
+            f.seek(start)
+            chunk = f.read(search_end - start)
+
+            found = chunk.rfind(marker)
+            if found < 0:
+                if start == lower:
+                    return
+                # Overlap the chunks, so no marker is split
+                search_end = start + len(marker) - 1
+                continue
+
+            # Continue before this marker, if it is not valid
+            search_end = start + found + len(marker) - 1
+
+            position = start + found + 1
+            f.seek(position)
+            line = f.readline()
+            fields = line.split()
+            if not line.endswith(b'\n') or len(fields) != 5:
+                continue
+
+            offset, packets, size = int(fields[1]), int(fields[2]), int(fields[3])
+            if position - size < self.end:
+                continue
+
+            # The segment before the checkpoint has to be intact
+            f.seek(position - size)
+            if zlib.crc32(f.read(size)) != int(fields[4], 16):
+                continue
+
+            self.offset = self.checkpoint = offset
+            self.packets = packets
+            self.end = position + len(line)
+            return
+
+    def read_tail(self, f):
+        """Adds the complete lines after the checkpoint, stops at the first broken one"""
+        checkpoint = self.end, self.offset, self.packets
+        f.seek(self.end)
+
+        for line in f:
+            if not line.endswith(b'\n'):
+                break
+
+            # A later checkpoint failed its CRC, the lines before it are corrupt
+            text = line.decode(errors='replace')
+            if text.startswith(h.CHECKPOINT_PREFIX):
+                self.end, self.offset, self.packets = checkpoint
+                break
+
+            match = h.LINE_PATTERN.fullmatch(text, endpos=len(text) - 1)
+            if match is None:
+                break
+
+            self.offset += int(match.group('delay'))
+            if not match.group('sync'):
+                self.packets += 1
+            self.end += len(line)
+
+    def footer_info(self):
+        """Returns the info like ArtNetPlayback.get_footer_info
+
+        Returns:
+            tuple(int[duration in ms], list[int(universes)])
+        """
+        return round(self.offset * 10**-6), self.universes
+
+    def recover(self, out: Path = None):
+        """Cuts the broken tail, writes the footer and renames the file
+
+        Args:
+            out (Path): New name, default the path without '.part'
+
+        Returns:
+            Path: Recovered recording
+        """
+        if out is None:
+            out = self.path.with_suffix('') if self.path.suffix == '.part' else self.path
+
+        with open(self.path, 'r+b') as f:
+            f.truncate(self.end)
+            f.seek(0, SEEK_END)
+            f.write(('!' + h.format_universes(self.universes) + " " + str(self.footer_info()[0]) + "\n").encode())
+            f.flush()
+            fsync(f.fileno())
+
+        if out != self.path:
+            rename(self.path, out)
+        return out
+
+
+def shard_paths(path: Path):
+    """Returns the shard streams of a sharded recording, see ShardedRecord
+
+    Args:
+        path (Path): Part file of the recording
+    """
+    return sorted(path.parent.glob(escape(path.name) + '.shard*'))
+
+
+def merge_shards(paths: list, out: Path):
+    """Merges the shard streams of a sharded recording by offset into one footerless recording
+
+    Every stream ends at its last valid line, like a crashed recording.
+
+    Args:
+        paths (list): Shard streams, each one with header and checkpoints
+        out (Path): Merged recording, overwritten
+    """
+    infos = [RecoveryInfo(path) for path in paths]
+
+    def stream(info):
+        offset = position = 0
+        with open(info.path, 'rb') as f:
+            for line in f:
+                position += len(line)
+                if position > info.end:
+                    return
+                if line[:1] == b'#':
+                    continue
+
+                split = line.index(b' ')
+                offset += int(line[:split])
+                yield offset, line[split:].decode()
+
+    last = 0
+    with open(out, 'w', newline='\n') as writer:
+        writer.write(h.make_header(sorted(set().union(*(info.universes for info in infos)))))
+        for offset, rest in heapq.merge(*map(stream, infos)):
+            writer.write(str(offset - last) + rest)
+            last = offset
+
+
+def run_recovery(path: Path):
+    """Recovers a recording from the command line and prints a summary
+
+    A sharded recording is merged from its shard streams first.
+
+    Args:
+        path (Path): Footerless recording
+    """
+    shards = shard_paths(path)
+    if shards:
+        merge_shards(shards, path)
+        for shard in shards:
+            remove(shard)
+        print("Merged {} shard streams into '{}'".format(len(shards), path))
+
+    info = RecoveryInfo(path)
+    lost = info.size - info.end
+    out = info.recover()
+
+    print(h.bcolors.OKGREEN + "Recovered '{}': {:.1f}s, {} packets, universes {}".format(
+        out, info.offset * 10**-9, info.packets, h.format_universes(info.universes)) + h.bcolors.ENDC)
+    print("Last valid checkpoint at {}, {} broken bytes cut from the end".format(
+        "{:.1f}s".format(info.checkpoint * 10**-9) if info.checkpoint is not None else "-", lost))
@@ -0,0 +1,282 @@
+#!/usr/bin/env python
+import signal
+import socket
+import threading
+import time
+import zlib
+
+from multiprocessing import Event, Process
+from multiprocessing.shared_memory import SharedMemory
+from os import cpu_count, fsync, remove, stat
+from pathlib import Path
+from select import select
+from struct import pack_into, unpack_from
+
+# local imports
+import helpfunctions as h
+from artnet_tools import ArtNetRecord
+from recovery import merge_shards
+from smartnet import SmartNetServer, bind_server_socket, enable_timestamps, receive_time
+
+# Ring buffer layout, one per shard:
+# [u64 write count][u64 read count] SLOTS * [i64 timestamp][u16 length][packet]
+RING_HEADER = 16
+SLOT_SIZE = 544  # 8 + 2 + 530 bytes of a full ArtDmx packet, padded
+SLOTS = 16384  # ~9MB per shard, ~6s of 64 universes at 44Hz
+
+
+def shard_worker(shm_name: str, stream_path: Path, stop, universes: list, start: int, checkpoint: int,
+                 channels: dict):
+    """Worker process, formats the packets of one shard and writes them to its own stream.
+
+    The stream is a recording of the universes of the shard, with header
+    and fsynced checkpoints, so it can be recovered after a crash. The
+    delays of all shards count from the same start.
+
+    Args:
+        shm_name (str): Name of the shared memory ring buffer
+        stream_path (Path): Stream file of this shard
+        stop (Event): Set, after the reader wrote its last packet
+        universes (list): Universes of this shard
+        start (int): Monotonic start of the recording in ns
+        checkpoint (int): Time between checkpoints in ns, 0 disables them
+        channels (dict): Channel count per universe, only these channels are stored
+    """
+    # Ctrl+C is handled by the main process, which stops the workers after the reader
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+    shm = SharedMemory(name=shm_name)
+    ring = shm.buf
+    read = 0
+
+    last = start
+    packets = 0
+    segment_crc = segment_size = 0
+    next_checkpoint = start + checkpoint
+
+    with open(stream_path, 'w', newline='\n') as writer:
+        writer.write(h.make_header(universes))
+        writer.flush()
+
+        while True:
+            # Check the flag first, so no packet written before stop can be missed
+            stopping = stop.is_set()
+            written = unpack_from('<Q', ring, 0)[0]
+
+            if read == written:
+                if stopping:
+                    break
+                time.sleep(0.001)
+                continue
+
+            while read < written:
+                offset = RING_HEADER + (read % SLOTS) * SLOT_SIZE
+                timestamp, size = unpack_from('<qH', ring, offset)
+                offset += 10
+
+                # Conversion jitter of the receive times, delays never run backwards
+                timestamp = max(timestamp, last)
+                if ring[offset + 9] == 0x52:
+                    line = "%d sync\n" % (timestamp - last)
+                else:
+                    universe = ring[offset + 14] | ring[offset + 15] << 8
+                    end = offset + min(size, 18 + channels.get(universe, size))
+                    line = "%d %d %s\n" % (timestamp - last, universe, list(ring[offset + 18:end]))
+                    packets += 1
+                last = timestamp
+                read += 1
+
+                writer.write(line)
+                segment_crc = zlib.crc32(line.encode(), segment_crc)
+                segment_size += len(line)
+
+                if checkpoint and last >= next_checkpoint:
+                    writer.write(h.make_checkpoint(last - start, packets, segment_size, segment_crc))
+                    writer.flush()
+                    fsync(writer.fileno())
+                    segment_crc = segment_size = 0
+                    next_checkpoint = last + checkpoint
+
+            # Free the slots for the reader
+            pack_into('<Q', ring, 8, read)
+
+    del ring
+    shm.close()
+
+
+class ShardedRecord(ArtNetRecord):
+    """Records with one worker process per shard of universes.
+
+    A single reader thread only receives and copies the raw packets into
+    a shared memory ring buffer of the shard the universe belongs to. The
+    worker processes do the formatting and writing in parallel, their
+    streams are merged by offset when the recording is saved. Until then
+    they sit next to the part file, -m recover merges them after a crash.
+    """
+
+    def __init__(self, universes: list, rec_dur: int, path: Path, compress=False, debug: int = 0, shards: int = 0,
+                 checkpoint: float = ArtNetRecord.CHECKPOINT_INTERVAL, channels: dict = None, interfaces: list = None,
+                 sources: list = None, forward: list = None):
+        """Initializes Sharded Recording Class.
+
+        Args:
+            universes (list): List of universes to record
+            rec_dur (int): Duration of recording in minutes, 0 is infinite
+            shards (int): Number of worker processes, 0 for one per spare core
+            checkpoint (float): Seconds between checkpoints of every shard stream, 0 disables them
+            channels (dict): Channel count per universe, only these channels are stored
+            interfaces (list): IPs or interface names to listen on, all if None
+            sources (list): IPs of the senders to record, all if None
+            forward (list): Destinations "ip[/remap]" the received packets are forwarded to
+        """
+        super().__init__(universes, rec_dur, path, compress, debug, checkpoint=checkpoint, channels=channels,
+                         interfaces=interfaces, sources=sources, forward=forward)
+
+        self.shards = min(shards or max((cpu_count() or 2) - 1, 1), len(universes))
+        self.dropped = 0  # Packets lost because a ring buffer was full
+
+        # Universes are spread round robin, so every shard gets a similar load
+        self.shard_of = {u: i % self.shards for i, u in enumerate(sorted(universes))}
+        self.stream_paths = [Path(str(self.part_path) + '.shard{}'.format(i)) for i in range(self.shards)]
+
+        print(h.bcolors.OKBLUE + "Shards: {}".format(self.shards) + h.bcolors.ENDC)
+
+    def reader_thread(self):
+        """Receives packets and copies them into the ring buffer of their shard"""
+        # Other senders are dropped before they reach Python, if the kernel can do it
+        self.sockets, filtered = zip(*[bind_server_socket(i, SmartNetServer.UDP_PORT, self.allowed)
+                                       for i in self.interfaces or ['']])
+        self.kernel_filter = all(filtered) and bool(self.allowed)
+        allowed = set(self.allowed) if self.allowed and not self.kernel_filter else None
+
+        sockets = self.sockets
+        for sock in sockets:
+            sock.settimeout(0.2)
+        ancbufsize = min([enable_timestamps(sock) for sock in sockets])
+
+        scratch = bytearray(1024)
+        view = memoryview(scratch)
+        rings = [shm.buf for shm in self.shms]
+        written = [0] * self.shards
+        shard_of = self.shard_of
+        stats = self.stats
+        sources = self.sources
+        forwarder = self.forwarder
+
+        while self.listen:
+            # wait for any interface, a single one blocks in recv
+            ready = select(sockets, [], [], 0.2)[0] if len(sockets) > 1 else sockets
+
+            for sock in ready:
+                try:
+                    if ancbufsize:
+                        size, ancdata, unused_flags, address = sock.recvmsg_into((scratch,), ancbufsize)
+                        timestamp = receive_time(ancdata)
+                    else:
+                        size, address = sock.recvfrom_into(scratch)
+                        timestamp = time.monotonic_ns()
+                except socket.timeout:
+                    continue
+
+                if allowed is not None and address[0] not in allowed:
+                    sources.reject(address[0])
+                    continue
+
+                if view[:12] == SmartNetServer.ARTDMX_HEADER:
+                    if forwarder is not None and forwarder.forward(view[:size], address, timestamp):
+                        continue
+
+                    universe = scratch[14] | scratch[15] << 8
+                    sources.count(address[0], universe, size - 18)
+                    shard = shard_of.get(universe)
+                    if shard is None or size > SLOT_SIZE - 10:
+                        continue
+                    stats.count(universe, size - 18)
+
+                # ArtSync belongs to every universe, one shard is enough
+                elif view[:12] == SmartNetServer.ARTSYNC_HEADER:
+                    sources.count(address[0], None, size)
+                    shard = 0
+
+                else:
+                    sources.count(address[0], None, size)
+                    continue
+
+                ring = rings[shard]
+                count = written[shard]
+                if count - unpack_from('<Q', ring, 8)[0] >= SLOTS:
+                    self.dropped += 1
+                    continue
+
+                offset = RING_HEADER + (count % SLOTS) * SLOT_SIZE
+                pack_into('<qH', ring, offset, timestamp, size)
+                ring[offset + 10:offset + 10 + size] = view[:size]
+
+                # Publish the slot after it is written
+                written[shard] = count + 1
+                pack_into('<Q', ring, 0, count + 1)
+                self.last = timestamp
+
+        del rings
+        for sock in sockets:
+            sock.close()
+
+    def disk_usage(self):
+        """Returns the bytes of all shard streams on disk"""
+        return sum(stat(p).st_size for p in self.stream_paths if p.exists())
+
+    def writer_backlog(self):
+        """Returns the packets in the ring buffers, not yet taken by the workers"""
+        return "{} packets".format(sum(
+            unpack_from('<Q', shm.buf, 0)[0] - unpack_from('<Q', shm.buf, 8)[0] for shm in self.shms))
+
+    def merge_streams(self):
+        """Merges the shard streams by offset into the part file"""
+        merge_shards(self.stream_paths, self.part_path)
+        for path in self.stream_paths:
+            remove(path)
+
+    def record(self):
+        """Starts reader and workers, merges the streams and saves the file when the recording is finished"""
+
+        print("Recording started...\nPress Ctrl+C to stop prematurely.")
+
+        self.shms = [SharedMemory(create=True, size=RING_HEADER + SLOTS * SLOT_SIZE) for _ in range(self.shards)]
+        for shm in self.shms:
+            shm.buf[:RING_HEADER] = bytes(RING_HEADER)
+
+        # Timing variables, monotonic like the receive times
+        self.last = time.monotonic_ns()
+        self.start = self.last
+
+        stop = Event()
+        workers = [Process(target=shard_worker, daemon=True,
+                           args=(shm.name, path, stop, [u for u in self.universes if self.shard_of[u] == i],
+                                 self.start, self.checkpoint_interval, self.channels))
+                   for i, (shm, path) in enumerate(zip(self.shms, self.stream_paths))]
+        for worker in workers:
+            worker.start()
+
+        self.listen = True
+        reader = threading.Thread(target=self.reader_thread, daemon=True)
+        reader.start()
+
+        self.wait_for_recording()
+
+        # Stop reader first, then let the workers drain their rings
+        self.listen = False
+        reader.join()
+        stop.set()
+        for worker in workers:
+            worker.join()
+
+        for shm in self.shms:
+            shm.close()
+            shm.unlink()
+
+        if self.dropped:
+            print(h.bcolors.FAIL + "Dropped {} packets, ring buffers were full.".format(self.dropped) + h.bcolors.ENDC)
+
+        self.merge_streams()
+        self.save()
+        self.report_network(self.kernel_filter)
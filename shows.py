@@ -0,0 +1,159 @@
+#!/usr/bin/env python
+import heapq
+import socket
+import threading
+import time
+
+from pathlib import Path
+
+# local imports
+import helpfunctions as h
+from dashboard import Dashboard, TrafficStats
+from smartnet import Smartnet
+from timer import PlaybackTimer
+
+
+class Show:
+    """A recording played to its own target, starting at its own time."""
+
+    def __init__(self, path: Path, target_ip: str, start: float = 0, socket_client=None):
+        """Initializes a show.
+
+        Args:
+            path (Path): .artrec or .rawrec file
+            target_ip (str): IP of the Art-Net receiver of this show
+            start (float): Start in seconds after the engine started
+            socket_client (socket): UDP socket shared by all shows
+        """
+        self.path = path
+        self.name = path.stem
+        self.target_ip = target_ip
+        self.start = int(start * 10**9)
+        self.a = Smartnet(target_ip, [], socket_client=socket_client)
+        self.packets = 0
+        self.done = False
+
+    @classmethod
+    def parse(cls, spec: str, socket_client=None):
+        """Creates a show from "path@ip" or "path@ip+seconds"
+
+        Args:
+            spec (str): Show from the command line
+            socket_client (socket): UDP socket shared by all shows
+        """
+        path, _, target = spec.strip('" ').rpartition('@')
+        if not path:
+            raise ValueError("Show must be path@ip[+start]: " + spec)
+        target_ip, _, start = target.partition('+')
+        return cls(Path(path), target_ip, float(start or 0), socket_client)
+
+    def timeline(self, index: int, base: int, sync: bool):
+        """Generator over the packets of the show on the engine clock
+
+        Args:
+            index (int): Index of the show in the engine
+            base (int): Engine start on the timer clock in ns
+            sync (bool): Include recorded ArtSync packets
+
+        Yields:
+            tuple(int[deadline in ns], int[index], int[packet number], int[universe] or None, bytearray[data] or None)
+        """
+        with h.open_recording(self.path) as textfile:
+            # The packet number keeps equal deadlines in file order, the data is never compared
+            for number, (offset, universe, data) in enumerate(h.read_packets(textfile, sync)):
+                yield base + self.start + offset, index, number, universe, data
+        self.done = True
+
+    def state(self, elapsed: int):
+        if self.done:
+            return "done"
+        if elapsed < self.start:
+            return "starts in {:.0f}s".format((self.start - elapsed) * 10**-9)
+        return "{:.1f}s".format((elapsed - self.start) * 10**-9)
+
+
+class ShowEngine:
+    """Plays any number of shows at once from a single timing thread.
+
+    The packets of all shows are merged lazily into one timeline with a
+    heap, keyed by their deadline. One thread waits for the next deadline
+    and sends, so N shows cost about one playback, not N threads polling.
+    """
+
+    PREROLL = 10**8  # 100ms to open the files before the first deadline
+
+    def __init__(self, shows: list, sync: bool = False, timer: PlaybackTimer = None, debug: int = 0):
+        """Initializes the engine.
+
+        Args:
+            shows (list): "path@ip[+start]" specs or Show instances
+            sync (bool): Replay recorded ArtSync packets of every show
+            timer (PlaybackTimer): Waits for the packets, default hybrid sleep and spin
+        """
+        self.socket_client = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.shows = [s if isinstance(s, Show) else Show.parse(s, self.socket_client) for s in shows]
+        self.sync = sync
+        self.timer = timer or PlaybackTimer()
+        self.debug = debug
+        self.stats = TrafficStats()
+        for show in self.shows:
+            show.a.stats = self.stats
+
+        self.halt = False
+        self.base = None
+        self.worker = threading.Thread(target=self.play_thread)
+
+        print(h.bcolors.OKBLUE + "----------shows----------" + h.bcolors.ENDC)
+        for show in self.shows:
+            print("{} -> {} at +{:.1f}s".format(show.path, show.target_ip, show.start * 10**-9))
+
+    def play_thread(self):
+        """Sends the merged timeline of all shows"""
+        timer = self.timer
+        timer.setup()
+        self.base = timer.now() + self.PREROLL
+        shows = self.shows
+
+        timeline = heapq.merge(*(show.timeline(i, self.base, self.sync) for i, show in enumerate(shows)))
+        for deadline, index, number, universe, data in timeline:
+            if self.halt:
+                break
+
+            error = timer.wait(deadline)
+
+            show = shows[index]
+            if universe is None:
+                show.a.send_sync()
+            else:
+                show.a.send_data(data, universe)
+            show.packets += 1
+
+            if self.debug and number % self.debug == 0:
+                print("S: {}, U: {}, Timing: {}ms".format(show.name, universe, round(error * 10**-6, 6)))
+
+        timer.finish()
+
+    def status(self):
+        elapsed = self.timer.now() - self.base if self.base is not None else 0
+        return " | ".join("{} {}".format(show.name, show.state(elapsed)) for show in self.shows)
+
+    def run(self):
+        """Plays all shows until they are finished or Ctrl+C"""
+        self.worker.start()
+        dashboard = Dashboard(self.stats)
+
+        try:
+            while self.worker.is_alive():
+                dashboard.show(self.status())
+                time.sleep(0.2)
+            print('Finished!')
+
+        except KeyboardInterrupt:
+            self.halt = True
+            self.worker.join()
+            print("\n\nTERMINATED BY USER, Stopping shows.\n")
+
+        self.timer.report()
+        for show in self.shows:
+            print("{}: {} packets".format(show.name, show.packets))
+        self.socket_client.close()
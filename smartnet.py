@@ -1,8 +1,25 @@
 #!/usr/bin/python
 
+import ctypes
 import socket
+import sys
+from select import select
+from struct import Struct
 from threading import Timer,Thread
-from time import time, sleep
+from time import time, sleep, time_ns, monotonic_ns
+
+# Kernel receive timestamps, struct timespec in CLOCK_REALTIME (Linux only)
+# Not exported by the socket module, 35 is the value of the common Linux architectures
+SO_TIMESTAMPNS = getattr(socket, 'SO_TIMESTAMPNS', 35 if sys.platform.startswith('linux') else None)
+TIMESPEC = Struct('ll')
+
+# Binding to a network device and classic BPF socket filters (Linux only), values of linux/socket.h and filter.h
+SO_BINDTODEVICE = getattr(socket, 'SO_BINDTODEVICE', 25)
+SO_ATTACH_FILTER = 26
+SKF_NET_OFF = -0x100000  # Offsets from the IP header instead of the UDP header
+BPF_LD_W_ABS, BPF_JEQ_K, BPF_RET_K = 0x20, 0x15, 0x06
+BPF_INSTRUCTION = Struct('HBBI')  # struct sock_filter
+BPF_PROGRAM = Struct('HP')  # struct sock_fprog
 
 def shift_this(number, high_first=True):
     """Utility method: extracts MSB and LSB from number.
@@ -33,6 +50,37 @@ def put_in_range(number, range_min, range_max, make_even=True):
     return number
 
 
+def port_address(universe, sub=0, net=0):
+    """Utility method: combines net, subnet and universe to a 15 bit Port-Address.
+
+    The universe may exceed 15, it is added as offset to net and subnet,
+    so a plain universe number 0-32767 is its own Port-Address.
+
+    Args:
+    universe - Universe or Port-Address
+    sub - Subnet (0-15)
+    net - Net (0-127)
+
+    Returns:
+    int - Port-Address (0-32767)
+
+    """
+    return ((net & 0x7F) << 8 | (sub & 0x0F) << 4) + universe & 0x7FFF
+
+
+def split_port_address(address):
+    """Utility method: splits a 15 bit Port-Address.
+
+    Args:
+    address - Port-Address (0-32767)
+
+    Returns:
+    (net, sub, universe) - tuple with the address parts
+
+    """
+    return ((address >> 8) & 0x7F, (address >> 4) & 0x0F, address & 0x0F)
+
+
 def make_address_mask(universe, sub=0, net=0, is_simplified=True):
     """Returns the address bytes for a given universe, subnet and net.
 
@@ -80,12 +128,123 @@ def make_address_mask(universe, sub=0, net=0, is_simplified=True):
     return address_mask
 
 
+def enable_timestamps(sock):
+    """Utility method: lets the kernel timestamp every packet received on sock.
+
+    Args:
+    sock - UDP socket
+
+    Returns:
+    int - ancillary buffer size for recvmsg, 0 if kernel timestamps are not available
+
+    """
+    if SO_TIMESTAMPNS is None or not hasattr(sock, 'recvmsg'):
+        return 0
+    try:
+        sock.setsockopt(socket.SOL_SOCKET, SO_TIMESTAMPNS, 1)
+    except OSError:
+        return 0
+    return socket.CMSG_SPACE(TIMESPEC.size)
+
+
+def bind_server_socket(interface='', port=6454, sources=None):
+    """Utility method: opens a UDP server socket on one interface.
+
+    A socket bound to an IP only receives unicast to that IP, bound to
+    an interface name it also receives broadcasts (needs root on kernels before 5.7).
+
+    Args:
+    interface - '' for all, an IP of this host or an interface name like eth0
+    port - UDP port
+    sources - IPs of the senders to accept, see attach_source_filter
+
+    Returns:
+    (socket, filtered) - bound UDP socket and whether the kernel drops other senders
+
+    """
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+
+    # Before binding, so no packet of other senders is queued
+    filtered = attach_source_filter(sock, sources) if sources else False
+
+    address = interface
+    if interface:
+        try:
+            socket.inet_aton(interface)
+        except OSError:
+            sock.setsockopt(socket.SOL_SOCKET, SO_BINDTODEVICE, interface.encode())
+            address = ''
+
+    sock.bind((address, port))
+    return sock, filtered
+
+
+def attach_source_filter(sock, sources):
+    """Utility method: lets the kernel drop packets of other senders, before they are queued.
+
+    Attaches a classic BPF program that compares the source address of
+    the IP header with every allowed source.
+
+    Args:
+    sock - UDP socket, not yet bound
+    sources - allowed IPs
+
+    Returns:
+    boolean - whether the filter is attached, else the sources have to be checked after receiving
+
+    """
+    if not sys.platform.startswith('linux') or not 0 < len(sources) < 256:
+        return False
+
+    count = len(sources)
+    try:
+        program = [BPF_INSTRUCTION.pack(BPF_LD_W_ABS, 0, 0, (SKF_NET_OFF + 12) & 0xFFFFFFFF)]
+        for i, source in enumerate(sources):
+            # Jump over the remaining compares and the reject to the accept
+            address = int.from_bytes(socket.inet_aton(source), 'big')
+            program.append(BPF_INSTRUCTION.pack(BPF_JEQ_K, count - i, 0, address))
+        program.append(BPF_INSTRUCTION.pack(BPF_RET_K, 0, 0, 0))
+        program.append(BPF_INSTRUCTION.pack(BPF_RET_K, 0, 0, 0xFFFFFFFF))
+
+        # The kernel copies the program, the buffer only has to live during the call
+        buffer = ctypes.create_string_buffer(b''.join(program))
+        sock.setsockopt(socket.SOL_SOCKET, SO_ATTACH_FILTER, BPF_PROGRAM.pack(len(program), ctypes.addressof(buffer)))
+    except OSError:
+        return False
+    return True
+
+
+def receive_time(ancdata):
+    """Utility method: returns the monotonic receive time of a packet.
+
+    The kernel stamps in wall clock time, it is moved to the monotonic
+    clock by its age, so wall clock steps (NTP) don't end up in recordings.
+    Without a kernel timestamp the current monotonic time is used.
+
+    Args:
+    ancdata - ancillary data returned by recvmsg
+
+    Returns:
+    int - monotonic time in ns
+
+    """
+    for level, kind, cdata in ancdata:
+        if level == socket.SOL_SOCKET and kind == SO_TIMESTAMPNS:
+            sec, nsec = TIMESPEC.unpack_from(cdata)
+            return monotonic_ns() - (time_ns() - (sec * 1000000000 + nsec))
+    return monotonic_ns()
+
+
 class Smartnet():
     """(Very) simple implementation of Artnet."""
 
     UDP_PORT = 6454
+    profiler = None  # StageProfiler of the sending thread
+    stats = None  # TrafficStats, counted by the sending thread
 
-    def __init__(self, target_ip='127.0.0.1', universes: list = [0],fps=40, broadcast=False):
+    def __init__(self, target_ip='127.0.0.1', universes: list = [0],fps=40, broadcast=False, channels: dict = None,
+                 socket_client=None):
         """Initializes Art-Net Client.
 
         Args:
@@ -93,6 +252,8 @@ class Smartnet():
         universes - universes to listen
         fps - transmition rate
         broadcast - whether to broadcast in local sub
+        channels - highest channel in use per universe (even), packets are trimmed to it
+        socket_client - UDP socket shared with other clients, a new one if None
 
         Returns:
         None
@@ -103,10 +264,11 @@ class Smartnet():
         self.sequence = 0
         self.subnet = 0
         self.net = 0
-        self.header_list = list() # contains a header with every universe
+        self.headers = dict() # contains a header for every universe (Port-Address)
+        self.channels = channels or dict()
 
         # UDP SOCKET
-        self.socket_client = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.socket_client = socket_client or socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
 
         if broadcast:
             self.socket_client.setsockopt(
@@ -116,20 +278,13 @@ class Smartnet():
         self.fps = fps
         self.__clock = None
 
-        #make set of headers for every universe
-        universes.sort()
-        i = 0
+        # ArtSync never changes, build it once
+        self.sync_packet = self.make_sync_packet()
+
+        #make set of headers for every universe, sparse so high or scattered universes cost nothing
         for u in universes:
-            if i == u:
-                self.header_list.append(self.make_header_no_packetsize(self.net, self.subnet, u))
-                i += 1
-            else:
-                while(i != u): # in case universes are skipped, so index matches with universe
-                    self.header_list.append(None)
-                    i += 1
-                self.header_list.append(self.make_header_no_packetsize(self.net, self.subnet, u))
-                i += 1
-    
+            self.add_universe(u)
+
     
     def __del__(self):
         """Graceful shutdown."""
@@ -150,8 +305,15 @@ class Smartnet():
 
         return state
 
+    def add_universe(self, universe: int):
+        """Precomputes the header of a universe (Port-Address) and returns it."""
+        header = self.headers[universe] = bytes(self.make_header_no_packetsize(self.net, self.subnet, universe))
+        return header
+
     def make_header_no_packetsize(self, net: int, subnet: int, universe: int):
-        """Creates Header to save in set and add packetsize dynamically."""
+        """Creates Header to save in set and add packetsize dynamically.
+
+        The universe may be a full 15 bit Port-Address, see port_address."""
         # 0 - id (7 x bytes + Null)
         tmp = bytearray()
         tmp.extend(bytearray('Art-Net', 'utf8'))
@@ -175,8 +337,9 @@ class Smartnet():
         # this means 16 * 16 * 128 = 32768 universes per port
         # a subnet is a group of 16 Universes
         # 16 subnets will make a net, there are 128 of them
-        tmp.append(subnet << 4 | universe)
-        tmp.append(net & 0xFF)
+        address = port_address(universe, subnet, net)
+        tmp.append(address & 0xFF)
+        tmp.append(address >> 8)
         return tmp
 
     def __make_packetsize_byte(self, packet_size):
@@ -188,10 +351,95 @@ class Smartnet():
         psize.append(lsb)
         return psize
 
+    @staticmethod
+    def make_sync_packet():
+        """Creates an ArtSync packet, receivers output all universes received before at once."""
+        tmp = bytearray()
+        tmp.extend(bytearray('Art-Net', 'utf8'))
+        tmp.append(0x0)
+        # 8 - opcode (2 x 8 low byte first)
+        tmp.append(0x00)
+        tmp.append(0x52)  # ArtSync packet
+        # 10 - prototocol version (2 x 8 high byte first)
+        tmp.append(0x0)
+        tmp.append(14)
+        # 12 - aux1, aux2
+        tmp.append(0x00)
+        tmp.append(0x00)
+        return tmp
+
+    def send_sync(self):
+        """Send ArtSync packet."""
+        try:
+            self.socket_client.sendto(self.sync_packet, (self.target_ip, self.UDP_PORT))
+        except socket.error as error:
+            print(f"ERROR: Socket error with exception: {error}")
+
+    @staticmethod
+    def make_timecode_packet(frames: int, seconds: int, minutes: int, hours: int, tc_type: int = 1):
+        """Creates an ArtTimeCode packet.
+
+        Args:
+        frames, seconds, minutes, hours - timecode position
+        tc_type - 0 = Film (24fps), 1 = EBU (25fps), 2 = DF (29.97fps), 3 = SMPTE (30fps)
+
+        Returns:
+        bytearray - packet to send
+        """
+        tmp = bytearray()
+        tmp.extend(bytearray('Art-Net', 'utf8'))
+        tmp.append(0x0)
+        # 8 - opcode (2 x 8 low byte first)
+        tmp.append(0x00)
+        tmp.append(0x97)  # ArtTimeCode packet
+        # 10 - prototocol version (2 x 8 high byte first)
+        tmp.append(0x0)
+        tmp.append(14)
+        # 12 - filler, 13 - stream id (0 = master)
+        tmp.append(0x00)
+        tmp.append(0x00)
+        # 14 - timecode
+        tmp.append(frames)
+        tmp.append(seconds)
+        tmp.append(minutes)
+        tmp.append(hours)
+        tmp.append(tc_type)
+        return tmp
+
+    def send_timecode(self, frames: int, seconds: int, minutes: int, hours: int, tc_type: int = 1):
+        """Send ArtTimeCode packet."""
+        try:
+            self.socket_client.sendto(self.make_timecode_packet(frames, seconds, minutes, hours, tc_type),
+                                      (self.target_ip, self.UDP_PORT))
+        except socket.error as error:
+            print(f"ERROR: Socket error with exception: {error}")
+
+    def make_packet(self, data: bytearray, universe: int):
+        """Assembles a complete ArtDmx packet."""
+        header = self.headers.get(universe) or self.add_universe(universe)
+
+        # unused channels at the end are not sent
+        limit = self.channels.get(universe)
+        if limit is not None and len(data) > limit:
+            data = data[:limit]
+
+        packet = bytearray(header)
+        packet.extend(self.__make_packetsize_byte(len(data)))
+        packet.extend(data)
+        return packet
+
+    def send_packet(self, packet):
+        """Send a preassembled packet."""
+        try:
+            self.socket_client.sendto(packet, (self.target_ip, self.UDP_PORT))
+        except socket.error as error:
+            print(f"ERROR: Socket error with exception: {error}")
+
     def send_data(self, data: bytearray, universe: int):
         """Finally send data."""
-        packet = self.header_list[universe] + self.__make_packetsize_byte(len(data))
-        packet.extend(data)
+        prof = self.profiler
+        packet = self.make_packet(data, universe)
+        if prof: prof.lap('header')
 
         try:
             self.socket_client.sendto(packet, (self.target_ip, self.UDP_PORT))
@@ -200,6 +448,13 @@ class Smartnet():
         finally:
             self.sequence = (self.sequence + 1) % 256
 
+        if self.stats:
+            self.stats.count(universe, len(data))
+
+        if prof:
+            prof.lap('sendto')
+            prof.packet()
+
     def close(self):
         """Close UDP socket."""
         self.socket_client.close()
@@ -241,42 +496,139 @@ class SmartNetServer():
 
     UDP_PORT = 6454
     socket_server = None
+    sources = None # SourceStats, counted by the server thread
+    BATCH = 256 # packets taken at once for a raw listener
     ARTDMX_HEADER = b'Art-Net\x00\x00P\x00\x0e'
+    ARTTIMECODE_HEADER = b'Art-Net\x00\x00\x97\x00\x0e'
+    ARTSYNC_HEADER = b'Art-Net\x00\x00R\x00\x0e'
     listeners = []
 
-    def __init__(self):
-        """Initializes Art-Net server."""
+    def __init__(self, profiler=None, interfaces=None, sources=None):
+        """Initializes Art-Net server.
+
+        Args:
+        profiler - StageProfiler, times the stages of the server thread
+        interfaces - IPs or interface names to listen on, all if None
+        sources - IPs of the senders to accept, all if None
+        """
         # server active flag
         self.listen = True
+        self.profiler = profiler
+        self.interfaces = interfaces or ['']
+        self.allowed = set(sources) if sources else None
+        self.kernel_filter = False # whether the kernel drops the other sources
+        self.packet_time = monotonic_ns() # monotonic receive time of the packet in dispatch
+        self.listeners = []
+        self.listener_map = dict() # address mask -> listeners, rebuilt on every change
+        self.timecode_callback = None
+        self.sync_callback = None
+        self.raw_callback = None
 
-        self.server_thread = Thread(target=self.__init_socket, daemon=True)
+        self.server_thread = Thread(target=profiler.wrap(self.__init_socket) if profiler else self.__init_socket,
+                                    daemon=True)
         self.server_thread.start()
 
     def __init_socket(self):
-        """Initializes server socket."""
-        # Bind to UDP on the correct PORT
-        self.socket_server = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
-        self.socket_server.setsockopt(
-            socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
-        self.socket_server.bind(('', self.UDP_PORT))  # Listen on any valid IP
+        """Initializes server sockets."""
+        # Bind to UDP on the correct PORT, one socket per interface
+        # Other senders are dropped before they reach Python, if the kernel can do it
+        sources = sorted(self.allowed) if self.allowed is not None else None
+        self.sockets, filtered = zip(*[bind_server_socket(i, self.UDP_PORT, sources) for i in self.interfaces])
+        self.kernel_filter = all(filtered) and sources is not None
+        allowed = None if self.kernel_filter else self.allowed
+
+        self.socket_server = self.sockets[0]
+        ancbufsize = min([enable_timestamps(sock) for sock in self.sockets])
+        prof = self.profiler
 
         while self.listen:
 
-            data, unused_address = self.socket_server.recvfrom(1024)
-
-            # only dealing with Art-Net DMX
-            if self.validate_header(data):
-
-                # check if this address is in any registered listener
-                for listener in self.listeners:
-
-                    # is it the address we are listening to
-                    if listener['address_mask'] == data[14:16]: #  and self.listen
-                        listener['buffer'] = list(data)[18:]
-
-                        # check for registered callbacks
-                        if listener['callback'] is not None:
-                            listener['callback'](listener['buffer'], listener['universe'])
+            # wait for any interface, a single one blocks in recv
+            ready = select(self.sockets, [], [])[0] if len(self.sockets) > 1 else self.sockets
+
+            for sock in ready:
+                if prof: prof.mark()
+                if ancbufsize:
+                    data, ancdata, unused_flags, address = sock.recvmsg(1024, ancbufsize)
+                    self.packet_time = receive_time(ancdata)
+                else:
+                    data, address = sock.recvfrom(1024)
+                    self.packet_time = monotonic_ns()
+                if prof: prof.lap('recv')
+
+                if allowed is not None and address[0] not in allowed:
+                    if self.sources: self.sources.reject(address[0])
+                    continue
+
+                raw = self.raw_callback
+                if raw is None:
+                    self.__dispatch(data, address)
+                    continue
+
+                # Everything queued goes to the raw listener first, before any packet is parsed
+                batch = []
+                if not (self.validate_header(data) and raw(data, address, self.packet_time)):
+                    batch.append((data, address, self.packet_time))
+                batch = self.__drain(sock, ancbufsize, allowed, raw, batch)
+                if prof: prof.lap('raw')
+
+                for data, address, self.packet_time in batch:
+                    self.__dispatch(data, address)
+
+    def __drain(self, sock, ancbufsize, allowed, raw, batch):
+        """Forwards the packets already queued on sock to raw and adds them to batch, up to BATCH, without waiting.
+
+        Every packet goes to raw as soon as it is received, the parsing waits for the batch.
+        Packets raw returns True for are dropped.
+        """
+        while len(batch) < self.BATCH:
+            try:
+                if ancbufsize:
+                    data, ancdata, unused_flags, address = sock.recvmsg(1024, ancbufsize, socket.MSG_DONTWAIT)
+                    received = receive_time(ancdata)
+                else:
+                    data, address = sock.recvfrom(1024, socket.MSG_DONTWAIT)
+                    received = monotonic_ns()
+            except BlockingIOError:
+                break
+
+            if allowed is not None and address[0] not in allowed:
+                if self.sources: self.sources.reject(address[0])
+                continue
+            if self.validate_header(data) and raw(data, address, received):
+                continue
+            batch.append((data, address, received))
+        return batch
+
+    def __dispatch(self, data, address):
+        """Hands a packet to the listeners."""
+        prof = self.profiler
+
+        # only dealing with Art-Net DMX
+        if self.validate_header(data):
+            if prof: prof.lap('validate')
+
+            if self.sources: self.sources.count(address[0], data[14] | data[15] << 8, len(data) - 18)
+
+            # only the listeners of this address
+            for listener in self.listener_map.get(data[14:16], ()):
+                listener['buffer'] = list(data)[18:]
+                if prof: prof.lap('dispatch')
+
+                # check for registered callbacks
+                if listener['callback'] is not None:
+                    listener['callback'](listener['buffer'], listener['universe'])
+            return
+
+        if self.sources: self.sources.count(address[0], None, len(data))
+
+        # Art-Net Sync, only if someone is recording it
+        if self.sync_callback is not None and data[:12] == self.ARTSYNC_HEADER:
+            self.sync_callback()
+
+        # Art-Net TimeCode, only if someone is chasing it
+        elif self.timecode_callback is not None and self.validate_timecode_header(data):
+            self.timecode_callback(data[14], data[15], data[16], data[17], data[18])
 
     def __del__(self):
         """Graceful shutdown."""
@@ -316,6 +668,7 @@ class SmartNetServer():
         }
 
         self.listeners.append(new_listener)
+        self.__map_listeners()
 
         return listener_id
 
@@ -337,6 +690,40 @@ class SmartNetServer():
             listener_list.append(self.register_listener(universe, sub, net, is_simplified, callback_function))
         return listener_list
     
+    def __map_listeners(self):
+        """Rebuilds the lookup of listeners by their address mask."""
+        listener_map = dict()
+        for listener in self.listeners:
+            listener_map.setdefault(bytes(listener['address_mask']), []).append(listener)
+
+        # swap at once, the server thread may be reading it
+        self.listener_map = listener_map
+
+    def register_timecode_listener(self, callback_function):
+        """Registers a callback for ArtTimeCode packets.
+
+        Args:
+        callback_function - Function to call with (frames, seconds, minutes, hours, type)
+        """
+        self.timecode_callback = callback_function
+
+    def register_raw_listener(self, callback_function):
+        """Registers a callback for every ArtDmx packet, called before the universe listeners.
+
+        Args:
+        callback_function - Function to call with (packet, sender address, monotonic receive time),
+        returns True to drop the packet
+        """
+        self.raw_callback = callback_function
+
+    def register_sync_listener(self, callback_function):
+        """Registers a callback for ArtSync packets.
+
+        Args:
+        callback_function - Function to call without arguments
+        """
+        self.sync_callback = callback_function
+
     def delete_listener(self, listener_id):
         """Deletes a registered listener.
 
@@ -348,6 +735,7 @@ class SmartNetServer():
         """
         self.listeners = [
             i for i in self.listeners if not i['id'] == listener_id]
+        self.__map_listeners()
 
     def delete_all_listener(self):
         """Deletes all registered listeners.
@@ -356,6 +744,7 @@ class SmartNetServer():
         None
         """
         self.listeners = []
+        self.__map_listeners()
 
     def see_buffer(self, listener_id):
         """Show buffer values."""
@@ -401,6 +790,7 @@ class SmartNetServer():
                 listener['simplified'] = is_simplified
                 listener['address_mask'] = address_mask
                 listener['buffer'] = []
+        self.__map_listeners()
 
     def close(self):
         """Close UDP socket."""
@@ -422,4 +812,17 @@ class SmartNetServer():
         boolean - comparison value
 
         """
-        return header[:12] == SmartNetServer.ARTDMX_HEADER
\ No newline at end of file
+        return header[:12] == SmartNetServer.ARTDMX_HEADER
+
+    @staticmethod
+    def validate_timecode_header(header):
+        """Validates packet header as Art-Net TimeCode packet (OPCode 0x9700).
+
+        Args:
+        header - Packet header as bytearray
+
+        Returns:
+        boolean - comparison value
+
+        """
+        return header[:12] == SmartNetServer.ARTTIMECODE_HEADER and len(header) >= 19
@@ -0,0 +1,249 @@
+#!/usr/bin/env python
+import sys
+import threading
+import time
+
+# local imports
+import helpfunctions as h
+from smartnet import Smartnet
+
+# ArtTimeCode types: 0 = Film, 1 = EBU, 2 = DF, 3 = SMPTE
+TC_FPS = {0: 24, 1: 25, 2: 29.97, 3: 30}
+
+
+def timecode_to_ns(frames: int, seconds: int, minutes: int, hours: int, tc_type: int = 1):
+    """Converts a timecode to its position in ns
+
+    Args:
+        frames, seconds, minutes, hours (int): timecode position
+        tc_type (int): ArtTimeCode type, see TC_FPS
+
+    Returns:
+        int: position in ns, the first ns of the frame
+    """
+    # Rounded up, ns_to_timecode returns the same frame again
+    if tc_type == 2:
+        # Drop frame, two frame numbers are skipped every minute except every 10th
+        total_minutes = 60 * hours + minutes
+        frame_number = (hours * 3600 + minutes * 60 + seconds) * 30 + frames \
+            - 2 * (total_minutes - total_minutes // 10)
+        return -(-frame_number * 1001 * 10**9 // 30000)
+
+    fps = TC_FPS[tc_type]
+    return -(-(((hours * 60 + minutes) * 60 + seconds) * fps + frames) * 10**9 // fps)
+
+
+def ns_to_timecode(position: int, tc_type: int = 1):
+    """Converts a position in ns to a timecode
+
+    Args:
+        position (int): position in ns
+        tc_type (int): ArtTimeCode type, see TC_FPS
+
+    Returns:
+        tuple(frames, seconds, minutes, hours)
+    """
+    if tc_type == 2:
+        frame_number = position * 30000 // (1001 * 10**9)
+
+        # Add the dropped frame numbers back in
+        tens, rest = divmod(frame_number, 17982)
+        frame_number += 18 * tens + (2 * ((rest - 2) // 1798) if rest > 1 else 0)
+        fps = 30
+    else:
+        fps = TC_FPS[tc_type]
+        frame_number = position * fps // 10**9
+
+    seconds, frames = divmod(frame_number, fps)
+    minutes, seconds = divmod(seconds, 60)
+    hours, minutes = divmod(minutes, 60)
+    return frames, seconds, minutes, hours % 24
+
+
+def parse_timecode(text: str):
+    """Parses "HH:MM:SS:FF" into (frames, seconds, minutes, hours)"""
+    hours, minutes, seconds, frames = map(int, text.strip('" ').replace(';', ':').split(':'))
+    return frames, seconds, minutes, hours
+
+
+def format_timecode(frames: int, seconds: int, minutes: int, hours: int):
+    return "{:02d}:{:02d}:{:02d}:{:02d}".format(hours, minutes, seconds, frames)
+
+
+class PlaybackClock:
+    """Media clock with seek and rate, position runs on the monotonic clock.
+
+    The state is swapped as one tuple, so other threads can seek or trim
+    the rate without locking the playback thread.
+    """
+
+    def __init__(self, position: int = 0, rate: float = 1.0):
+        self._state = (position, time.monotonic_ns(), rate)
+        self.generation = 0  # Incremented on every seek
+
+    def position(self, now: int = None):
+        """Returns the media position in ns"""
+        base, since, rate = self._state
+        return base + int(((now or time.monotonic_ns()) - since) * rate)
+
+    @property
+    def rate(self):
+        return self._state[2]
+
+    def seek(self, position: int):
+        """Jumps to the position, the playback thread has to follow"""
+        self._state = (position, time.monotonic_ns(), self._state[2])
+        self.generation += 1
+
+    def set_rate(self, rate: float):
+        """Changes the rate without moving the current position"""
+        now = time.monotonic_ns()
+        self._state = (self.position(now), now, rate)
+
+
+class TimecodeChaser:
+    """Keeps a PlaybackClock locked to incoming ArtTimeCode.
+
+    Jumps bigger than JUMP_THRESHOLD seek the clock, smaller drift is
+    corrected by trimming the clock rate.
+    """
+
+    JUMP_THRESHOLD = 200 * 10**6  # 200ms
+    FREEWHEEL = 500 * 10**6  # Stop, if no timecode is received for 0.5s
+    MAX_TRIM = 0.05  # Max. rate deviation of 5%
+    GAIN = 2.0  # Rate correction per second of offset
+    SMOOTHING = 0.1  # EMA factor of the measured offset
+
+    def __init__(self, clock: PlaybackClock, start: int = 0):
+        """Initializes the chaser.
+
+        Args:
+            clock (PlaybackClock): clock to keep in sync
+            start (int): timecode in ns at which the recording starts
+        """
+        self.clock = clock
+        self.start = start
+
+        self.timecode = None  # Last received (frames, seconds, minutes, hours, type)
+        self.last_received = 0
+        self.offset = 0  # Smoothed offset timecode - clock in ns
+        self.locked = False
+
+        # Statistics
+        self.seek_time = None  # monotonic time of the last seek, until the first packet
+        self.lock_latencies = []
+        self.residuals = []
+
+    def on_timecode(self, frames, seconds, minutes, hours, tc_type):
+        """SmartNetServer timecode callback"""
+        now = time.monotonic_ns()
+        target = timecode_to_ns(frames, seconds, minutes, hours, tc_type) - self.start
+        self.timecode = (frames, seconds, minutes, hours, tc_type)
+
+        # Restart after a timecode pause or jump
+        error = target - self.clock.position(now)
+        if now - self.last_received > self.FREEWHEEL or abs(error) > self.JUMP_THRESHOLD:
+            self.clock.seek(target)
+            self.clock.set_rate(1.0)
+            self.offset = 0
+            self.locked = False
+            self.seek_time = now
+
+        else:
+            self.offset += self.SMOOTHING * (error - self.offset)
+            trim = max(-self.MAX_TRIM, min(self.MAX_TRIM, self.offset * 10**-9 * self.GAIN))
+            self.clock.set_rate(1.0 + trim)
+
+            if self.locked:
+                self.residuals.append(self.offset)
+
+        self.last_received = now
+
+    def check_freewheel(self):
+        """Pauses the clock, if the timecode stopped"""
+        if self.clock.rate != 0 and time.monotonic_ns() - self.last_received > self.FREEWHEEL:
+            self.clock.set_rate(0)
+            self.locked = False
+
+    def on_first_packet(self):
+        """Called by the playback thread with the first packet after a seek"""
+        if self.seek_time is not None:
+            self.lock_latencies.append(time.monotonic_ns() - self.seek_time)
+            self.seek_time = None
+            self.locked = True
+
+    def status(self):
+        """Returns a one line status string"""
+        if self.timecode is None:
+            return "Waiting for timecode..."
+        return "TC {} | {} | offset {:+.2f}ms | rate {:.4f}".format(
+            format_timecode(*self.timecode[:4]), "LOCKED" if self.locked else "chasing",
+            self.offset * 10**-6, self.clock.rate)
+
+    def report(self):
+        """Prints lock latency and residual offset"""
+        if self.lock_latencies:
+            print("Lock latency: avg {:.2f}ms, max {:.2f}ms ({} locks)".format(
+                sum(self.lock_latencies) / len(self.lock_latencies) * 10**-6,
+                max(self.lock_latencies) * 10**-6, len(self.lock_latencies)))
+        if self.residuals:
+            print("Residual offset: avg {:+.3f}ms, max {:.3f}ms".format(
+                sum(self.residuals) / len(self.residuals) * 10**-6,
+                max(abs(r) for r in self.residuals) * 10**-6))
+
+
+class TimecodeGenerator:
+    """Sends ArtTimeCode with the frame rate of the timecode type."""
+
+    def __init__(self, target_ip: str, tc_type: int = 1, start: str = "00:00:00:00"):
+        """Initializes the generator.
+
+        Args:
+            target_ip (str): IP or broadcast address of the chasing hosts
+            tc_type (int): ArtTimeCode type, see TC_FPS
+            start (str): start timecode "HH:MM:SS:FF"
+        """
+        self.tc_type = tc_type
+        self.clock = PlaybackClock(timecode_to_ns(*parse_timecode(start), tc_type), rate=0)
+        self.a = Smartnet(target_ip, [], broadcast=target_ip.endswith('.255'))
+        self.halt = False
+
+        self.worker = threading.Thread(target=self.generator_thread, daemon=True)
+
+    def generator_thread(self):
+        frame = 10**9 / TC_FPS[self.tc_type]
+
+        while not self.halt:
+            position = self.clock.position()
+            self.a.send_timecode(*ns_to_timecode(position, self.tc_type), self.tc_type)
+
+            # Sleep until the next frame boundary
+            next_frame = (int(position // frame) + 1) * frame
+            time.sleep(max((next_frame - position) / (self.clock.rate or 1), 0) * 10**-9)
+
+    def start(self):
+        self.clock.set_rate(1.0)
+        if not self.worker.is_alive():
+            self.worker.start()
+
+    def jump(self, timecode: str):
+        self.clock.seek(timecode_to_ns(*parse_timecode(timecode), self.tc_type))
+
+    def stop(self):
+        self.halt = True
+        self.worker.join()
+        self.a.close()
+
+    def run(self):
+        """Runs the generator until Ctrl+C"""
+        print(h.bcolors.OKBLUE + "----------timecode----------\nAdress: {}\nType: {}fps".format(
+            self.a.target_ip, TC_FPS[self.tc_type]) + h.bcolors.ENDC)
+        self.start()
+        try:
+            while True:
+                sys.stdout.write("\r" + format_timecode(*ns_to_timecode(self.clock.position(), self.tc_type)))
+                sys.stdout.flush()
+                time.sleep(0.2)
+        except KeyboardInterrupt:
+            print("\n\nTERMINATED BY USER, Stopping timecode.\n")
+        self.stop()
@@ -0,0 +1,155 @@
+#!/usr/bin/env python
+import os
+
+from array import array
+from time import perf_counter_ns, sleep
+
+# local imports
+import helpfunctions as h
+
+
+class PlaybackTimer:
+    """Waits for packet deadlines and measures how well they were met.
+
+    Strategies, from least CPU to most precise:
+        sleep    sleeps, sends right away when due within EARLY_WINDOW
+        hybrid   sleeps until SPIN_WINDOW before the deadline, then spins
+        spin     spins the whole time, keeps one core busy
+
+    The sleep overshoot of Linux is about 50-100us, the spin window has to
+    cover it. Dedicated hosts can run the playback thread with SCHED_FIFO
+    on an isolated core to remove scheduling delays as well.
+    """
+
+    STRATEGIES = ('sleep', 'hybrid', 'spin')
+    EARLY_WINDOW = 5 * 10**5  # 0.5ms
+    SPIN_WINDOW = 2 * 10**5  # 200us
+    REALTIME_PRIORITY = 50
+    SAMPLES = 1 << 16  # Timing errors kept for the percentiles
+
+    def __init__(self, strategy: str = 'hybrid', spin_window: int = SPIN_WINDOW, realtime: bool = False,
+                 cpu: int = None):
+        """Initializes the timer.
+
+        Args:
+            strategy (str): One of STRATEGIES
+            spin_window (int): Time in ns spun before the deadline (hybrid)
+            realtime (bool): Run the playback thread with SCHED_FIFO
+            cpu (int): Pin the playback thread to this CPU
+        """
+        if strategy not in self.STRATEGIES:
+            raise ValueError("Invalid timer strategy, use one of {}".format(self.STRATEGIES))
+        self.strategy = strategy
+        self.spin_window = spin_window
+        self.realtime = realtime
+        self.cpu = cpu
+
+        self.errors = array('q', bytes(8 * self.SAMPLES))  # Send time minus deadline of the latest waited packets in ns
+        self.started = None
+        self.clear()
+
+    def clear(self):
+        """Starts a new measurement, the error samples are reused"""
+        self.waited = 0  # Packets waited for
+        self.min_error = self.max_error = 0
+        self.abs_error = 0  # Sum of the absolute errors in ns
+        self.behind = 0  # Packets already overdue when the wait started
+        self.max_behind = 0
+        self.spun = 0  # Time spent spinning in ns
+        self.elapsed = 0  # Time spent in playback threads in ns
+
+    def setup(self):
+        """Applies scheduling and affinity to the calling thread, call it first in the playback thread"""
+        self.started = perf_counter_ns()
+
+        if self.cpu is not None:
+            try:
+                os.sched_setaffinity(0, {self.cpu})
+            except (AttributeError, OSError) as e:
+                print(h.bcolors.WARNING + "Can't pin playback to CPU {}: {}".format(self.cpu, e) + h.bcolors.ENDC)
+
+        if self.realtime:
+            try:
+                os.sched_setscheduler(0, os.SCHED_FIFO, os.sched_param(self.REALTIME_PRIORITY))
+            except (AttributeError, OSError) as e:
+                print(h.bcolors.WARNING + "Can't use SCHED_FIFO (needs root or CAP_SYS_NICE): {}".format(e)
+                      + h.bcolors.ENDC)
+
+    def finish(self):
+        """Books the playback time of the calling thread, call it last in the playback thread"""
+        if self.started is not None:
+            self.elapsed += perf_counter_ns() - self.started
+            self.started = None
+
+    @staticmethod
+    def now():
+        return perf_counter_ns()
+
+    def wait(self, deadline: int):
+        """Waits until the deadline
+
+        Args:
+            deadline (int): perf_counter_ns time the packet is due
+
+        Returns:
+            int: Timing error in ns, negative if early
+        """
+        time_left = deadline - perf_counter_ns()
+
+        # Overdue packets are bound by processing, not by the timer
+        if time_left <= 0:
+            self.behind += 1
+            self.max_behind = max(self.max_behind, -time_left)
+            return -time_left
+
+        if self.strategy == 'sleep':
+            if time_left > self.EARLY_WINDOW:
+                sleep(time_left * 10**-9)
+
+        else:
+            if self.strategy == 'hybrid' and time_left > self.spin_window:
+                sleep((time_left - self.spin_window) * 10**-9)
+
+            spin_start = now = perf_counter_ns()
+            while now < deadline:
+                now = perf_counter_ns()
+            self.spun += now - spin_start
+
+        error = perf_counter_ns() - deadline
+        self.errors[self.waited % self.SAMPLES] = error
+        if self.waited:
+            self.min_error = min(error, self.min_error)
+            self.max_error = max(error, self.max_error)
+        else:
+            self.min_error = self.max_error = error
+        self.abs_error += abs(error)
+        self.waited += 1
+        return error
+
+    def report(self):
+        """Prints the timing error distribution and the spin time since the last report, then clears them
+
+        Min, max and mean are exact, the percentiles come from the latest SAMPLES packets.
+        """
+        if not self.waited and not self.behind:
+            return
+
+        print("\n----------timer: {}----------".format(self.strategy))
+
+        if self.waited:
+            errors = sorted(self.errors[:min(self.waited, self.SAMPLES)])
+            count = len(errors)
+
+            def percentile(p):
+                return errors[min(int(count * p), count - 1)] * 10**-3
+
+            print("{} waited packets, error in us: min {:.1f}, median {:.1f}, p99 {:.1f}, max {:.1f}, "
+                  "mean abs {:.1f}".format(self.waited, self.min_error * 10**-3, percentile(0.5), percentile(0.99),
+                                           self.max_error * 10**-3, self.abs_error / self.waited * 10**-3))
+        if self.behind:
+            print("{} packets were already overdue, max {:.1f}us late".format(self.behind, self.max_behind * 10**-3))
+        if self.elapsed:
+            print("Spinning {:.0f}ms, {:.1f}% of the playback thread".format(
+                self.spun * 10**-6, self.spun / self.elapsed * 100))
+
+        self.clear()